@@ -0,0 +1,280 @@
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+import traceback
+import numpy as np
+import pandas as pd
+import syntheticData
+
+#every stage runs in its own forked process inside the scale's data directory, so peak RSS is per stage
+DATA_DIRECTORY = "benchmarkData"
+BASELINE_FILE = "benchmarkBaselines.json"
+DEFAULT_SCALES = [1000, 10000, 100000]
+PREPARED_FILE = "prepared.json"
+#bumped whenever prepareInputs changes what it builds, so prepared files of an older version are rebuilt
+PREPARED_VERSION = 2
+#dense text matrices and the per-user friend scan are quadratic; larger inputs are skipped or sampled
+TXT_MATRIX_LIMIT = 3200
+FRIEND_SCAN_ROWS = 500
+MIN_REGRESSION_SECONDS = 0.05
+#edge weight the MinHash/LSH stage targets, and the recall drop against the baseline reported as a regression
+LSH_THRESHOLD = 0.1
+MIN_REGRESSION_RECALL = 0.01
+
+
+def peakRssMb():
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+
+def mostReviewedBusiness():
+	counts = pd.read_csv("review.csv", usecols=['business_id']).business_id.value_counts()
+	return counts.index[0]
+
+def loadPrepared():
+	if not os.path.exists(PREPARED_FILE):
+		return None
+	with open(PREPARED_FILE) as f:
+		prepared = json.load(f)
+	return prepared if prepared.get('version') == PREPARED_VERSION else None
+
+def prepareInputs():
+	#derived files the stages read, built once per scale with the repo's own functions; every business is a graph node,
+	#unlike the review_count >= 100 cut of the real pipeline, so the graph grows with the scale
+	import centralityComputation
+	import extractFeatures
+	import friendGraph
+	prepared = loadPrepared()
+	if prepared is not None:
+		return prepared
+	businesses = pd.read_csv("business.csv", usecols=['business_id', 'name', 'latitude', 'longitude', 'review_count'])
+	reviews = pd.read_csv("review.csv", usecols=['user_id', 'business_id', 'stars'])
+	reviews = reviews[reviews.business_id.isin(businesses.business_id) & (reviews.stars >= 4)]
+	satisfiedUsers = reviews.groupby('business_id', sort=False).user_id.apply(list)
+	businesses['satisfiedUsers'] = [str(users) for users in satisfiedUsers.reindex(businesses.business_id).apply(lambda users: users if isinstance(users, list) else [])]
+	businesses.to_csv("businessesWithSatisfiedUsers.csv", index=False)
+	centralityComputation.createBusinessWeightMatrix(businesses)
+	matrix, businessIds = centralityComputation.loadMatrix("weightMatrix.bin")
+	centralityComputation.createGraphFromMatrix(matrix, businessIds, graphDirectory="businessGraph")
+	centralityComputation.addLocationAttributes("businessGraph", "businessesWithSatisfiedUsers.csv")
+	if len(businesses) <= TXT_MATRIX_LIMIT:
+		np.savetxt("weightMatrix.txt", centralityComputation.centralityBackend.symmetricMatrix(matrix).toarray().ravel(), fmt="%.6g")
+	businessId = mostReviewedBusiness()
+	columns = ["user_id", "business_id", "date", "text"]
+	reviews = pd.read_csv("review.csv", usecols=columns)
+	reviews[reviews.business_id == businessId].to_csv("firstCommentReviews.csv", index=False)
+	tips = pd.read_csv("tip.csv", usecols=columns)
+	tips[tips.business_id == businessId].to_csv("firstCommentTips.csv", index=False)
+	firstComments = extractFeatures.computeFirstComments(pd.read_csv("firstCommentReviews.csv"), pd.read_csv("firstCommentTips.csv"))
+	firstComments.sort_values('firstComment', kind='mergesort').to_csv("usersReviewingImportantBusinesses.csv", index=False)
+	friendGraph.getFriendGraph("user.csv", "friendGraph")
+	#edges are the stored upper-triangular nonzeros, each business pair once
+	prepared = {'version': PREPARED_VERSION, 'graphNodes': matrix.shape[0], 'graphEdges': matrix.nnz, 'businessId': businessId}
+	with open(PREPARED_FILE, "w") as f:
+		json.dump(prepared, f)
+	return prepared
+
+
+def setupWeightMatrix():
+	return (pd.read_csv("businessesWithSatisfiedUsers.csv"), )
+
+def runWeightMatrix(businessesWithSatisfiedUsers):
+	import centralityComputation
+	centralityComputation.createBusinessWeightMatrix(businessesWithSatisfiedUsers)
+
+def setupApproximateWeights():
+	import coReviewMatrix
+	incidence, userCounts, businessIds = coReviewMatrix.buildIncidenceMatrixFromDataFrame("businessesWithSatisfiedUsers.csv")
+	return incidence, userCounts
+
+def runApproximateWeights(incidence, userCounts):
+	import minHashLsh
+	return minHashLsh.computeApproximateWeights(incidence, userCounts, LSH_THRESHOLD)
+
+def approximateWeightsRecall(approximateMatrix, incidence, userCounts):
+	#share of the exact engine's edges above LSH_THRESHOLD that LSH found, measured after the clock stops
+	import centralityComputation
+	import minHashLsh
+	exactMatrix, businessIds = centralityComputation.loadMatrix("weightMatrix.bin")
+	return {'recall': minHashLsh.recall(exactMatrix, approximateMatrix, LSH_THRESHOLD)}
+
+def runAverageDistance():
+	import centralityComputation
+	centralityComputation.computeAverageGeographicalDistance("businessGraph")
+
+def runTipCount():
+	import filterCity
+	filterCity.addTipCount("business.csv", "tip.csv")
+
+def setupFriendScan():
+	import friendGraph
+	users = pd.read_csv("usersReviewingImportantBusinesses.csv")
+	friends = friendGraph.loadFriendGraph("friendGraph")
+	friendLists = [friends.friendsOf(userId) if userId in friends else [] for userId in users.user_id[:FRIEND_SCAN_ROWS]]
+	return users, friendLists
+
+def runFriendScan(users, friendLists):
+	import extractFeatures
+	for i, friends in enumerate(friendLists):
+		extractFeatures.getListOfUsersWhoCommentedAfter(friends, users, i)
+
+def setupFriendsWhoCommentedAfter():
+	import friendGraph
+	return pd.read_csv("usersReviewingImportantBusinesses.csv"), friendGraph.loadFriendGraph("friendGraph")
+
+def runFriendsWhoCommentedAfter(users, friends):
+	import influence
+	influence.computeFriendsWhoCommentedAfter(users.user_id, users.firstComment, friends)
+
+def setupFirstComments():
+	return pd.read_csv("firstCommentReviews.csv"), pd.read_csv("firstCommentTips.csv")
+
+def runFirstComments(reviews, tips):
+	import extractFeatures
+	extractFeatures.getDatesOfFirstComment(reviews, tips)
+
+def runLoadMatrixFromTxt():
+	import centralityComputation
+	centralityComputation.loadMatrixFromTxt("weightMatrix.txt")
+
+def runLoadMatrix():
+	import centralityComputation
+	matrix, businessIds = centralityComputation.loadMatrix("weightMatrix.bin")
+	matrix.sum()
+
+def hasTxtMatrix():
+	return os.path.exists("weightMatrix.txt")
+
+#name: (setup returning the timed function's arguments, timed function, precondition checked in the data directory)
+STAGES = [
+	('createBusinessWeightMatrix', setupWeightMatrix, runWeightMatrix, None),
+	('computeApproximateWeights', setupApproximateWeights, runApproximateWeights, None),
+	('computeAverageGeographicalDistance', None, runAverageDistance, None),
+	('addTipCount', None, runTipCount, None),
+	('getListOfUsersWhoCommentedAfter', setupFriendScan, runFriendScan, None),
+	('computeFriendsWhoCommentedAfter', setupFriendsWhoCommentedAfter, runFriendsWhoCommentedAfter, None),
+	('getDatesOfFirstComment', setupFirstComments, runFirstComments, None),
+	('loadMatrixFromTxt', None, runLoadMatrixFromTxt, hasTxtMatrix),
+	('loadMatrix', None, runLoadMatrix, None)
+]
+#name: function of the timed function's result and arguments returning quality measurements, such as recall
+QUALITY_CHECKS = {'computeApproximateWeights': approximateWeightsRecall}
+
+
+def runInDirectory(directory, function, args, resultQueue):
+	try:
+		os.chdir(directory)
+		resultQueue.put(("ok", function(*args)))
+	except Exception:
+		resultQueue.put(("error", traceback.format_exc()))
+
+def runInChild(directory, function, args=()):
+	#forked so the parent's memory does not count towards the stage's peak RSS
+	resultQueue = multiprocessing.Queue()
+	process = multiprocessing.Process(target=runInDirectory, args=(directory, function, args, resultQueue))
+	process.start()
+	status, value = resultQueue.get()
+	process.join()
+	if status != "ok":
+		raise RuntimeError(value)
+	return value
+
+def measureStage(setup, function, precondition, check=None):
+	if precondition is not None and not precondition():
+		return None
+	#imported before the clock starts, so the timed functions' local imports are free
+	import centralityComputation, extractFeatures, filterCity, friendGraph, influence
+	args = setup() if setup is not None else ()
+	setupRss = peakRssMb()
+	startTime = time.time()
+	startCpu = time.clock()
+	result = function(*args)
+	measurement = {'seconds': time.time() - startTime, 'cpuSeconds': time.clock() - startCpu, 'peakRssMb': peakRssMb(), 'setupRssMb': setupRss}
+	if check is not None:
+		measurement.update(check(result, *args))
+	return measurement
+
+def prepareScale(numberOfBusinesses, seed=0):
+	directory = os.path.abspath(os.path.join(DATA_DIRECTORY, str(numberOfBusinesses)))
+	runInChild(".", syntheticData.writeDataset, (directory, numberOfBusinesses, seed))
+	prepared = runInChild(directory, prepareInputs)
+	return directory, prepared
+
+def runBenchmarks(scales=DEFAULT_SCALES, stageNames=None, seed=0):
+	results = {}
+	for numberOfBusinesses in scales:
+		directory, prepared = prepareScale(numberOfBusinesses, seed)
+		print "%d businesses: graph of %d nodes and %d edges" % (numberOfBusinesses, prepared['graphNodes'], prepared['graphEdges'])
+		results[str(numberOfBusinesses)] = {}
+		for name, setup, function, precondition in STAGES:
+			if stageNames is not None and name not in stageNames:
+				continue
+			measurement = runInChild(directory, measureStage, (setup, function, precondition, QUALITY_CHECKS.get(name)))
+			if measurement is None:
+				print "%d businesses, %s: skipped" % (numberOfBusinesses, name)
+				continue
+			line = "%d businesses, %s: %.3fs, peak RSS %.0f MB" % (numberOfBusinesses, name, measurement['seconds'], measurement['peakRssMb'])
+			print line + (", recall %.4f" % measurement['recall'] if 'recall' in measurement else "")
+			sys.stdout.flush()
+			measurement.update(graphNodes=prepared['graphNodes'], graphEdges=prepared['graphEdges'])
+			results[str(numberOfBusinesses)][name] = measurement
+	return results
+
+def loadBaselines(baselineFile=BASELINE_FILE):
+	if not os.path.exists(baselineFile):
+		return {}
+	with open(baselineFile) as f:
+		return json.load(f)
+
+def saveBaselines(results, baselineFile=BASELINE_FILE):
+	#merged into the stored baselines, so a partial run only replaces the stages it measured
+	baselines = loadBaselines(baselineFile)
+	for scale, stages in results.items():
+		baselines.setdefault(scale, {}).update(stages)
+	with open(baselineFile, "w") as f:
+		json.dump(baselines, f, indent=1, sort_keys=True)
+
+def compareWithBaselines(results, baselines, tolerance=0.25):
+	#a baseline measured on a graph of another size is shown but not compared, e.g. after the generator changed
+	rows = []
+	stageOrder = [stage[0] for stage in STAGES]
+	for scale, stages in sorted(results.items(), key=lambda item: int(item[0])):
+		for name, measurement in sorted(stages.items(), key=lambda item: stageOrder.index(item[0])):
+			baseline = baselines.get(scale, {}).get(name)
+			row = {'businesses': int(scale), 'nodes': measurement['graphNodes'], 'edges': measurement['graphEdges'], 'stage': name,
+				'seconds': measurement['seconds'], 'peakRssMb': measurement['peakRssMb'],
+				'recall': measurement.get('recall', np.nan), 'baselineSeconds': np.nan, 'baselineRssMb': np.nan, 'baselineRecall': np.nan,
+				'comparable': False, 'regression': False}
+			if baseline is not None:
+				row['baselineSeconds'] = baseline['seconds']
+				row['baselineRssMb'] = baseline['peakRssMb']
+				row['baselineRecall'] = baseline.get('recall', np.nan)
+				row['comparable'] = (baseline.get('graphNodes'), baseline.get('graphEdges')) == (measurement['graphNodes'], measurement['graphEdges'])
+			if row['comparable']:
+				slower = measurement['seconds'] > baseline['seconds'] * (1 + tolerance) and measurement['seconds'] - baseline['seconds'] > MIN_REGRESSION_SECONDS
+				larger = measurement['peakRssMb'] > baseline['peakRssMb'] * (1 + tolerance)
+				lessRecall = row['recall'] < row['baselineRecall'] - MIN_REGRESSION_RECALL
+				row['regression'] = slower or larger or lessRecall
+			rows.append(row)
+	return pd.DataFrame(rows, columns=['businesses', 'nodes', 'edges', 'stage', 'seconds', 'baselineSeconds', 'peakRssMb', 'baselineRssMb', 'recall', 'baselineRecall',
+		'comparable', 'regression'])
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description="Times the hot stages on seeded synthetic Yelp data")
+	parser.add_argument("--scales", default=",".join(str(scale) for scale in DEFAULT_SCALES), help="comma separated business counts")
+	parser.add_argument("--stages", default=None, help="comma separated stage names, all by default")
+	parser.add_argument("--seed", type=int, default=0)
+	parser.add_argument("--tolerance", type=float, default=0.25, help="relative slowdown or RSS growth reported as a regression")
+	parser.add_argument("--save-baseline", action="store_true", help="store this run's measurements as the new baselines")
+	arguments = parser.parse_args()
+	stageNames = arguments.stages.split(",") if arguments.stages else None
+	results = runBenchmarks([int(scale) for scale in arguments.scales.split(",")], stageNames, arguments.seed)
+	report = compareWithBaselines(results, loadBaselines(), arguments.tolerance)
+	print report.to_string(index=False)
+	if arguments.save_baseline:
+		saveBaselines(results)
+	elif report.regression.any():
+		sys.exit(1)
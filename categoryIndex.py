@@ -0,0 +1,110 @@
+import ast
+import os
+import numpy as np
+import pandas as pd
+from scipy import sparse
+import columnarCache
+
+CATEGORY_INDEX_DIRECTORY = "categoryIndex"
+
+
+def parseCategories(value):
+	#business.csv exports hold either a python list literal or a "A, B" / "A;B" string
+	if isinstance(value, (list, tuple)):
+		return [category.strip() for category in value]
+	if pd.isnull(value) or value == "":
+		return []
+	if value.startswith("["):
+		return [category.strip() for category in ast.literal_eval(value)]
+	separator = ";" if ";" in value else ","
+	return [category.strip() for category in value.split(separator) if category.strip()]
+
+
+def categoryText(category):
+	#python 2 reads business.csv as utf-8 byte strings; categories are kept and looked up as unicode
+	return category.decode("utf-8") if isinstance(category, bytes) else category
+
+
+class CategoryIndex(object):
+	#categories are interned to column ids; matrix[i, c] is set when business i is tagged with category c
+
+	def __init__(self, businessIds, categories, matrix):
+		self.businessIds = businessIds
+		self.categories = categories
+		self.matrix = sparse.csr_matrix(matrix)
+		self.byCategory = self.matrix.tocsc()
+		self.categoryIndex = dict((category, i) for i, category in enumerate(categories.tolist()))
+		self.lowerCategoryIndex = {}
+		for category, i in self.categoryIndex.items():
+			self.lowerCategoryIndex.setdefault(category.lower(), []).append(i)
+
+	def __len__(self):
+		return len(self.businessIds)
+
+	def categoryIdsOf(self, categories, ignoreCase=False):
+		#one list of ids per requested category; unknown categories give an empty list
+		if ignoreCase:
+			return [self.lowerCategoryIndex.get(categoryText(category).lower(), []) for category in categories]
+		categories = [categoryText(category) for category in categories]
+		return [[self.categoryIndex[category]] if category in self.categoryIndex else [] for category in categories]
+
+	def businessesWithCategory(self, categoryIds):
+		positions = [self.byCategory.indices[self.byCategory.indptr[i]:self.byCategory.indptr[i + 1]] for i in categoryIds]
+		return np.unique(np.concatenate(positions)) if positions else np.zeros(0, dtype=np.int32)
+
+	def businessesInAny(self, categories, ignoreCase=False):
+		#boolean mask over businesses tagged with at least one of the categories
+		mask = np.zeros(len(self.businessIds), dtype=bool)
+		for categoryIds in self.categoryIdsOf(categories, ignoreCase):
+			mask[self.businessesWithCategory(categoryIds)] = True
+		return mask
+
+	def businessesInAll(self, categories, ignoreCase=False):
+		mask = np.ones(len(self.businessIds), dtype=bool)
+		for categoryIds in self.categoryIdsOf(categories, ignoreCase):
+			matches = np.zeros(len(self.businessIds), dtype=bool)
+			matches[self.businessesWithCategory(categoryIds)] = True
+			mask &= matches
+		return mask
+
+	def categoryCounts(self, businessMask=None):
+		#number of businesses per category, most common first
+		matrix = self.matrix if businessMask is None else self.matrix[np.flatnonzero(businessMask)]
+		counts = np.bincount(matrix.indices, minlength=len(self.categories))
+		order = np.argsort(-counts, kind='mergesort')
+		return pd.Series(counts[order], index=self.categories[order])
+
+	def save(self, directory=CATEGORY_INDEX_DIRECTORY):
+		if not os.path.isdir(directory):
+			os.makedirs(directory)
+		np.save(os.path.join(directory, "businessIds.npy"), self.businessIds)
+		np.save(os.path.join(directory, "categories.npy"), self.categories)
+		sparse.save_npz(os.path.join(directory, "matrix.npz"), self.matrix)
+
+
+def buildCategoryIndex(businesses="business.csv"):
+	if not isinstance(businesses, pd.DataFrame):
+		businesses = columnarCache.readColumnar(businesses, ['business_id', 'categories'])
+	categoryLists = [parseCategories(value) for value in businesses.categories]
+	flatCategories = [category for categories in categoryLists for category in categories]
+	rows = np.repeat(np.arange(len(categoryLists)), [len(categories) for categories in categoryLists])
+	codes, categories = pd.factorize(pd.Series(flatCategories, dtype=object))
+	matrix = sparse.csr_matrix((np.ones(len(rows), dtype=np.int8), (rows, codes)), shape=(len(categoryLists), len(categories)))
+	#a category repeated on one business counts once
+	matrix.data[:] = 1
+	categories = np.asarray([categoryText(category) for category in categories], dtype=unicode)
+	return CategoryIndex(np.asarray(businesses.business_id.astype(str).tolist(), dtype=str), categories, matrix)
+
+def loadCategoryIndex(directory=CATEGORY_INDEX_DIRECTORY):
+	businessIds = np.load(os.path.join(directory, "businessIds.npy"))
+	categories = np.load(os.path.join(directory, "categories.npy"))
+	return CategoryIndex(businessIds, categories, sparse.load_npz(os.path.join(directory, "matrix.npz")))
+
+def getCategoryIndex(businessFile="business.csv", directory=CATEGORY_INDEX_DIRECTORY):
+	#rebuilt when business.csv is newer than the saved index
+	indexFile = os.path.join(directory, "matrix.npz")
+	if os.path.exists(indexFile) and os.path.getmtime(indexFile) >= os.path.getmtime(businessFile):
+		return loadCategoryIndex(directory)
+	categoryIndex = buildCategoryIndex(businessFile)
+	categoryIndex.save(directory)
+	return categoryIndex
@@ -0,0 +1,133 @@
+import heapq
+import os
+import numpy as np
+from scipy import sparse
+
+#the damping factor of the repo's analysis (nx.pagerank(G, alpha=0.15) in CentralityAnalysis.ipynb), not networkx's 0.85 default
+PAGERANK_ALPHA = 0.15
+
+def symmetricMatrix(matrix):
+	#weight matrices are stored as the upper triangle; centralities need both directions
+	upperTriangle = sparse.triu(sparse.csr_matrix(matrix), k=1)
+	return (upperTriangle + upperTriangle.T).tocsr()
+
+def weightedDegree(symmetric):
+	return np.asarray(symmetric.sum(axis=1)).ravel()
+
+def pagerank(symmetric, alpha=PAGERANK_ALPHA, tol=1.0e-6, maxIter=100, startVector=None):
+	#power iteration on the weight-normalized transition matrix, same conventions as nx.pagerank (tol is scaled by n)
+	n = symmetric.shape[0]
+	if n == 0:
+		return np.zeros(0)
+	outWeights = weightedDegree(symmetric)
+	dangling = outWeights == 0
+	inverseOutWeights = np.zeros(n)
+	inverseOutWeights[~dangling] = 1. / outWeights[~dangling]
+	transitionT = symmetric.T.dot(sparse.diags(inverseOutWeights)).tocsr()
+	if startVector is None or len(startVector) != n or np.sum(startVector) <= 0:
+		x = np.full(n, 1. / n)
+	else:
+		x = np.asarray(startVector, dtype=np.float64) / np.sum(startVector)
+	for iteration in range(maxIter):
+		previous = x
+		x = alpha * (transitionT.dot(previous) + previous[dangling].sum() / n) + (1 - alpha) / n
+		if np.abs(x - previous).sum() < n * tol:
+			return x
+	raise RuntimeError("pagerank did not converge in %d iterations" % maxIter)
+
+def eigenvectorCentrality(symmetric, tol=1.0e-6, maxIter=100, startVector=None):
+	#iterates x <- (A + I) x like nx.eigenvector_centrality, which also converges on bipartite components
+	n = symmetric.shape[0]
+	if n == 0:
+		return np.zeros(0)
+	if startVector is None or len(startVector) != n or np.sum(startVector) <= 0:
+		x = np.full(n, 1. / n)
+	else:
+		x = np.asarray(startVector, dtype=np.float64) / np.sum(startVector)
+	for iteration in range(maxIter):
+		previous = x
+		x = previous + symmetric.dot(previous)
+		norm = np.linalg.norm(x)
+		if norm == 0:
+			return x
+		x = x / norm
+		if np.abs(x - previous).sum() < n * tol:
+			return x
+	raise RuntimeError("eigenvector centrality did not converge in %d iterations" % maxIter)
+
+def singleSourceDependencies(symmetric, source):
+	#one Brandes pass with Dijkstra; an edge's length is 1 / weight, so strongly co-reviewed businesses are close
+	n = symmetric.shape[0]
+	indptr, indices, data = symmetric.indptr, symmetric.indices, symmetric.data
+	distance = np.full(n, np.inf)
+	pathCounts = np.zeros(n)
+	predecessors = [[] for x in range(n)]
+	order = []
+	distance[source] = 0.
+	pathCounts[source] = 1.
+	heap = [(0., source)]
+	settled = np.zeros(n, dtype=bool)
+	while heap:
+		nodeDistance, node = heapq.heappop(heap)
+		if settled[node]:
+			continue
+		settled[node] = True
+		order.append(node)
+		for position in range(indptr[node], indptr[node + 1]):
+			neighbor = indices[position]
+			if data[position] <= 0:
+				continue
+			candidate = nodeDistance + 1. / data[position]
+			if candidate < distance[neighbor] - 1e-12:
+				distance[neighbor] = candidate
+				pathCounts[neighbor] = pathCounts[node]
+				predecessors[neighbor] = [node]
+				heapq.heappush(heap, (candidate, neighbor))
+			elif abs(candidate - distance[neighbor]) <= 1e-12 and not settled[neighbor]:
+				pathCounts[neighbor] += pathCounts[node]
+				predecessors[neighbor].append(node)
+	dependencies = np.zeros(n)
+	for node in reversed(order):
+		for predecessor in predecessors[node]:
+			dependencies[predecessor] += pathCounts[predecessor] / pathCounts[node] * (1. + dependencies[node])
+	dependencies[source] = 0.
+	return dependencies
+
+def approximateBetweenness(symmetric, samples=100, seed=0):
+	#Brandes from `samples` random sources, rescaled to the full node count and normalized like nx.betweenness_centrality
+	n = symmetric.shape[0]
+	if n < 3:
+		return np.zeros(n)
+	symmetric = sparse.csr_matrix(symmetric)
+	samples = min(samples, n)
+	sources = np.random.RandomState(seed).choice(n, samples, replace=False)
+	betweenness = np.zeros(n)
+	for source in sources:
+		betweenness += singleSourceDependencies(symmetric, source)
+	return betweenness * (float(n) / samples) / ((n - 1) * (n - 2))
+
+def loadPreviousVectors(fileName, businessIds):
+	#aligns a previous run's vectors to the current business order; businesses new to this run start at 0
+	if fileName is None or not os.path.exists(fileName):
+		return {}
+	previous = np.load(fileName, allow_pickle=True)
+	positions = dict((businessId, i) for i, businessId in enumerate(previous['business_ids'].tolist()))
+	aligned = {}
+	for name in previous.files:
+		if name == 'business_ids':
+			continue
+		aligned[name] = np.array([previous[name][positions[businessId]] if businessId in positions else 0. for businessId in businessIds])
+	return aligned
+
+def computeCentralities(matrix, businessIds, previousFile=None, alpha=PAGERANK_ALPHA, tol=1.0e-6, betweennessSamples=100):
+	symmetric = symmetricMatrix(matrix)
+	previous = loadPreviousVectors(previousFile, businessIds)
+	centralities = {
+		'weighted_degree': weightedDegree(symmetric),
+		'pagerank': pagerank(symmetric, alpha, tol, startVector=previous.get('pagerank')),
+		'eigenvector': eigenvectorCentrality(symmetric, tol, startVector=previous.get('eigenvector')),
+		'betweenness': approximateBetweenness(symmetric, betweennessSamples)
+	}
+	if previousFile is not None:
+		np.savez(previousFile, business_ids=np.asarray(businessIds, dtype=str), **centralities)
+	return centralities
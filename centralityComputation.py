@@ -3,9 +3,22 @@ import numpy as np
 import ast
 import networkx as nx
 import json
+import os
 from scipy import stats
+from scipy import sparse
 from math import sin, cos, sqrt, atan2, radians
+import coReviewMatrix
+import matrixStore
+import geoDistance
+import csvStream
+import pipelineRunner
+import centralityBackend
+import graphStore
+import minHashLsh
+import instrumentation
+import filterCity
 
+@instrumentation.instrumented
 def filterBusinessesWithManyReviews(csvFile):
 	csvDataFrame = pd.read_csv(csvFile)
 	businessesWithManyReviews = csvDataFrame[csvDataFrame['review_count'] >= 100]
@@ -13,14 +26,15 @@ def filterBusinessesWithManyReviews(csvFile):
 	businessesWithManyReviews.to_csv("sinaBusinessFile.csv", index=False)
 	return businessesWithManyReviews
 
+@instrumentation.instrumented
 def filterByRating(csvDataFrame, reviewFile):
-	reviewFile = pd.read_csv(reviewFile, usecols=["user_id", "business_id", "date", "stars"])
-	reviewFile = reviewFile[reviewFile['business_id'].isin(csvDataFrame.business_id)]
-	reviewFile = reviewFile[reviewFile['stars'] >= 4]
-	reviewFile = reviewFile.reset_index(drop=True)	
+	businessIds = set(csvDataFrame.business_id)
+	reviewFile = csvStream.filterCsv(reviewFile, ["user_id", "business_id", "date", "stars"],
+		lambda chunk: chunk['business_id'].isin(businessIds) & (chunk['stars'] >= 4), parseDates=False)
 	reviewFile.to_csv("sinaReviewFile.csv", index=False)
 	return reviewFile
 
+@instrumentation.instrumented
 def addColumnUsersWhichReviewed(highRatedReviews, businessesWithManyReviews):
 	satisfiedUsers =  [[] for x in range(len(businessesWithManyReviews.review_count))]
 	for i in range(len(businessesWithManyReviews.business_id)):
@@ -31,95 +45,124 @@ def addColumnUsersWhichReviewed(highRatedReviews, businessesWithManyReviews):
 	businessesWithManyReviews.to_csv('businessesWithSatisfiedUsers.csv', index=False)
 	return businessesWithManyReviews
 
-def createBusinessWeightMatrix(businessesWithSatisfiedUsers):
+@instrumentation.instrumented
+def createBusinessWeightMatrix(businessesWithSatisfiedUsers, minOverlap=1, minWeight=0., lshThreshold=None, numberOfHashes=128):
+	#with lshThreshold set, only MinHash/LSH candidate pairs get exact weights; lshThreshold is an edge weight, and about 95% of the edges above it are kept
 	csvDataFrame = businessesWithSatisfiedUsers #pd.read_csv(businessesWithSatisfiedUsers)
-	weightMatrix = np.zeros((len(csvDataFrame.business_id), len(csvDataFrame.business_id)))
-	for i in range(len(weightMatrix)):
-		iList = []
-		try:
-			iList = csvDataFrame.satisfiedUsers[i]
-		except ValueError:
-			print csvDataFrame.satisfiedUsers[i]
-		iCount = len(iList)
-		for j in range(len(weightMatrix)):
-			jList = []
-			if(i < j):
-				jList = csvDataFrame.satisfiedUsers[j]
-				jCount = len(jList)
-				intersectIJ = list(set(iList) & set(jList))
-				intersectIJCount = len(intersectIJ)
-				weightMatrix[i][j] = (intersectIJCount/float(iCount) + intersectIJCount/float(jCount))/2.
-
-	with open('weightMatrix.txt', 'wb') as f:
-		for line in weightMatrix:
-			np.savetxt(f, line, fmt='%.5f')
-	f.close() 
-
-def loadMatrixFromTxt(matrixFile, lengthOfRow):
-	matrixFile = open(matrixFile, "r")
-	read_lines = matrixFile.readlines()
-	read_lines = [line.rstrip('\n') for line in read_lines]
-	loadedMatrix = np.zeros((lengthOfRow, lengthOfRow))
-	for i in range(lengthOfRow):
-		loadedMatrix[i][:lengthOfRow-1] = read_lines[i*lengthOfRow:(lengthOfRow*(i+1))-1]
-	return loadedMatrix
-
-def createGraphFromMatrix(matrix, businessesWithSatisfiedUsers):
-	businessesWithSatisfiedUsersDf = pd.read_csv(businessesWithSatisfiedUsers)
-	G = nx.Graph()
-
-	for i in range(len(matrix)):
-		iBusinessID = businessesWithSatisfiedUsersDf.business_id[i]
-		G.add_node(iBusinessID)
-		for j in range(len(matrix)):
-			if(i<j):
-				if(matrix[i][j] > 0.):
-					jBusinessID = businessesWithSatisfiedUsersDf.business_id[j]
-					G.add_weighted_edges_from([(iBusinessID, jBusinessID, matrix[i][j])])
-	saveGraphToFile('jsonGraph.json', G)
+	if lshThreshold is None:
+		sparseWeightMatrix, businessIds = coReviewMatrix.computeSparseWeightMatrix(csvDataFrame, minOverlap, minWeight)
+	else:
+		sparseWeightMatrix, businessIds = minHashLsh.computeApproximateWeightMatrix(csvDataFrame, lshThreshold, numberOfHashes,
+			minOverlap=minOverlap, minWeight=minWeight)
+	matrixStore.saveWeightMatrix('weightMatrix.bin', sparseWeightMatrix, businessIds)
+	return sparseWeightMatrix
+
+@instrumentation.instrumented
+def updateBusinessWeightMatrix(newReviewFile, stateDirectory='coReviewState', businessesWithSatisfiedUsers='businessesWithSatisfiedUsers.csv'):
+	#applies new high-rated reviews to the stored co-review state; only edges of businesses with new reviews are recomputed.
+	#Outside the pipeline only: runPipeline would rebuild weightMatrix.bin from businessesWithSatisfiedUsers.csv and drop the update,
+	#so pipeline runs pass newReviewFile to buildCentralityPipeline instead
+	if os.path.isdir(stateDirectory):
+		state = coReviewMatrix.loadCoReviewState(stateDirectory)
+	else:
+		state = coReviewMatrix.buildCoReviewState(businessesWithSatisfiedUsers)
+	newReviews = csvStream.filterCsv(newReviewFile, ["user_id", "business_id", "stars"], lambda chunk: chunk['stars'] >= 4, parseDates=False)
+	changes = state.applyReviews(newReviews)
+	state.save(stateDirectory)
+	matrixStore.saveWeightMatrix('weightMatrix.bin', state.weightMatrix, state.businessIds)
+	changes.to_csv('changedEdges.csv', index=False)
+	return changes
+
+def loadMatrix(matrixFile):
+	return matrixStore.loadWeightMatrix(matrixFile)
+
+@instrumentation.instrumented
+def loadMatrixFromTxt(matrixFile, lengthOfRow=None):
+	values = np.loadtxt(matrixFile, ndmin=1)
+	if lengthOfRow is None:
+		lengthOfRow = int(round(np.sqrt(len(values))))
+	return values.reshape((lengthOfRow, lengthOfRow))
+
+def selectGraphEdges(matrix, minWeight=0., topK=None):
+	upperTriangle = sparse.triu(sparse.coo_matrix(matrix), k=1).tocoo()
+	keep = upperTriangle.data > minWeight
+	rows, columns, weights = upperTriangle.row[keep], upperTriangle.col[keep], upperTriangle.data[keep]
+	if topK is not None and len(weights) > 0:
+		#an edge survives if it is among the topK heaviest edges of either endpoint
+		endpoints = np.concatenate([rows, columns])
+		edgeIndices = np.concatenate([np.arange(len(weights)), np.arange(len(weights))])
+		order = np.lexsort((-np.concatenate([weights, weights]), endpoints))
+		sortedEndpoints = endpoints[order]
+		groupStarts = np.searchsorted(sortedEndpoints, sortedEndpoints, side='left')
+		rankInGroup = np.arange(len(order)) - groupStarts
+		keep = np.zeros(len(weights), dtype=bool)
+		keep[edgeIndices[order][rankInGroup < topK]] = True
+		rows, columns, weights = rows[keep], columns[keep], weights[keep]
+	return rows, columns, weights
+
+@instrumentation.instrumented
+def createGraphFromMatrix(matrix, businessIds, minWeight=0., topK=None, graphDirectory='businessGraph'):
+	#businessIds are the matrix's row labels, as returned by loadMatrix; a DataFrame or CSV with a business_id column is also accepted
+	if businessIds is None:
+		raise ValueError("the matrix has no stored business ids; pass them to matrixStore.convertTxtMatrix or saveWeightMatrix")
+	if isinstance(businessIds, basestring):
+		businessIds = pd.read_csv(businessIds, usecols=['business_id'])
+	if isinstance(businessIds, pd.DataFrame):
+		businessIds = businessIds.business_id
+	businessIds = np.asarray(businessIds, dtype=object)
+	if len(businessIds) != matrix.shape[0]:
+		raise ValueError("%d business ids for a matrix with %d rows" % (len(businessIds), matrix.shape[0]))
+	rows, columns, weights = selectGraphEdges(matrix, minWeight, topK)
+	graphStore.saveGraphArrays(graphDirectory, businessIds, rows, columns, weights)
+
+def loadGraph(graphDirectory='businessGraph'):
+	return graphStore.loadGraph(graphDirectory)
 		
 def loadGraphFromJson(jsonFile):
 	graphJson = json.loads(open(jsonFile).read())
 	G = nx.readwrite.json_graph.node_link_graph(graphJson, multigraph=False)
-	#pr = nx.pagerank(G, alpha = 0.15)
 	return G
-def addLocationAttributes(G, businessesWithSatisfiedUsers):
-	businessesWithSatisfiedUsersDf = pd.read_csv(businessesWithSatisfiedUsers)
-	for i in range(len(businessesWithSatisfiedUsersDf.business_id)):
-		currentBusinessID = businessesWithSatisfiedUsersDf.business_id[i]
-		currentLatitude = businessesWithSatisfiedUsersDf.latitude[i]
-		currentLongitude = businessesWithSatisfiedUsersDf.longitude[i]
-		G.nodes[currentBusinessID]['longitude'] = currentLongitude
-		G.nodes[currentBusinessID]['latitude'] = currentLatitude
-	saveGraphToFile('jsonEnrichedGraph.json', G)
-
-def addNameAttribute(G, businessesWithManyReviews):
-	businessesWithManyReviewsDf = pd.read_csv(businessesWithManyReviews)
-	for i in range(len(businessesWithManyReviewsDf.business_id)):
-		currentBusinessID = businessesWithManyReviewsDf.business_id[i]
-		currentName = businessesWithManyReviewsDf.name[i]
-		G.nodes[currentBusinessID]['name'] = currentName
-	saveGraphToFile('jsonEnrichedGraph.json', G)
+@instrumentation.instrumented
+def addLocationAttributes(graphDirectory, businessesWithSatisfiedUsers):
+	businessesWithSatisfiedUsersDf = pd.read_csv(businessesWithSatisfiedUsers, usecols=['business_id', 'latitude', 'longitude'])
+	businessesWithSatisfiedUsersDf = businessesWithSatisfiedUsersDf.set_index('business_id')
+	graphStore.appendNodeAttribute(graphDirectory, 'latitude', businessesWithSatisfiedUsersDf.latitude)
+	graphStore.appendNodeAttribute(graphDirectory, 'longitude', businessesWithSatisfiedUsersDf.longitude)
+
+@instrumentation.instrumented
+def addNameAttribute(graphDirectory, businessesWithManyReviews):
+	businessesWithManyReviewsDf = pd.read_csv(businessesWithManyReviews, usecols=['business_id', 'name'])
+	graphStore.appendNodeAttribute(graphDirectory, 'name', businessesWithManyReviewsDf.set_index('business_id').name)
 
 def createSubGraphToVisualize(G):
 	firstNodes = list(G.nodes())[:30]
 	subGraph = G.subgraph(firstNodes)
 	saveGraphToFile('subGraph.json', subGraph)
 
-def computeAverageGeographicalDistance(G): 
-	nodesList = list(G.nodes())
-	for i in range(len(nodesList)):
-		currentNode = nodesList[i]
-		distance = 0.			
-		lat1 = G.nodes[currentNode]['latitude']
-		lon1 = G.nodes[currentNode]['longitude']
-		for j in range(len(nodesList)):
-			lat2 = G.nodes[nodesList[j]]['latitude']
-			lon2 = G.nodes[nodesList[j]]['longitude']
-			distance += computeGeographicalDistance(lat1, lon1, lat2, lon2)
-		averageDistance = distance / len(nodesList)
-		G.nodes[currentNode]['averageDistance'] = averageDistance
-	saveGraphToFile('jsonEnrichedGraph.json', G)
+def getNodeCoordinates(graphDirectory):
+	graphArrays = graphStore.loadGraphArrays(graphDirectory, ['latitude', 'longitude'])
+	return graphArrays['nodes'], graphArrays['attributes']['latitude'], graphArrays['attributes']['longitude']
+
+@instrumentation.instrumented
+def computeAverageGeographicalDistance(graphDirectory):
+	nodesList, latitudes, longitudes = getNodeCoordinates(graphDirectory)
+	averageDistances = geoDistance.averageDistances(latitudes, longitudes)
+	graphStore.appendNodeAttribute(graphDirectory, 'averageDistance', averageDistances)
+
+@instrumentation.instrumented
+def computeNeighborsWithinRadius(graphDirectory, radiusKm):
+	nodesList, latitudes, longitudes = getNodeCoordinates(graphDirectory)
+	spatialIndex = geoDistance.SpatialIndex(latitudes, longitudes, nodesList)
+	neighborCounts = spatialIndex.countWithinRadius(radiusKm)
+	graphStore.appendNodeAttribute(graphDirectory, 'neighborsWithinRadius', neighborCounts)
+	return spatialIndex
+
+@instrumentation.instrumented
+def addCentralityAttributes(graphDirectory, matrixFile, previousCentralitiesFile='centralities.npz', pagerankAlpha=centralityBackend.PAGERANK_ALPHA):
+	loadedMatrix, businessIds = loadMatrix(matrixFile)
+	centralities = centralityBackend.computeCentralities(loadedMatrix, businessIds, previousCentralitiesFile, pagerankAlpha)
+	for name, values in centralities.items():
+		graphStore.appendNodeAttribute(graphDirectory, name, dict(zip(businessIds.tolist(), values.tolist())))
 
 def saveGraphToFile(fileName, graphToSave):
 	savedData = nx.readwrite.json_graph.node_link_data(graphToSave)
@@ -166,21 +209,99 @@ def sortByWeights(G):
 	})	
 	df = df.sort_values(by=['weighted_degree'])
 	print df.name[:10]
+def filterByRatingStage(businessFile, reviewFile):
+	filterByRating(pd.read_csv(businessFile), reviewFile)
+
+def addColumnUsersWhichReviewedStage(reviewFile, businessFile):
+	addColumnUsersWhichReviewed(pd.read_csv(reviewFile), pd.read_csv(businessFile))
+
+def createBusinessWeightMatrixStage(businessesWithSatisfiedUsers, stateDirectory=None):
+	#with a stateDirectory the co-review state is kept as well, as the base that updateBusinessWeightMatrixStage applies new reviews to
+	if stateDirectory is None:
+		createBusinessWeightMatrix(pd.read_csv(businessesWithSatisfiedUsers))
+		return
+	state = coReviewMatrix.buildCoReviewState(businessesWithSatisfiedUsers)
+	state.save(stateDirectory)
+	matrixStore.saveWeightMatrix('weightMatrix.bin', state.weightMatrix, state.businessIds)
+
+def updateBusinessWeightMatrixStage(newReviewFile, stateDirectory):
+	#newReviewFile holds every review since businessesWithSatisfiedUsers.csv was built; they are applied to the saved base state,
+	#which is left as it is, so rerunning after more reviews are appended applies each review once
+	state = coReviewMatrix.loadCoReviewState(stateDirectory)
+	newReviews = csvStream.filterCsv(newReviewFile, ["user_id", "business_id", "stars"], lambda chunk: chunk['stars'] >= 4, parseDates=False)
+	changes = state.applyReviews(newReviews)
+	matrixStore.saveWeightMatrix('weightMatrix.bin', state.weightMatrix, state.businessIds)
+	changes.to_csv('changedEdges.csv', index=False)
+
+def createGraphFromMatrixStage(matrixFile, graphDirectory):
+	loadedMatrix, businessIds = loadMatrix(matrixFile)
+	createGraphFromMatrix(loadedMatrix, businessIds, graphDirectory=graphDirectory)
+
+def buildCentralityPipeline(businessFile="business.csv", reviewFile="review.csv", graphDirectory="businessGraph", newReviewFile=None,
+		stateDirectory="coReviewState"):
+	#with newReviewFile, the reviews in it are applied incrementally to the weight matrix before the graph stages read it
+	Stage = pipelineRunner.Stage
+	graphFiles = graphStore.graphFiles(graphDirectory)
+	nodesFile = graphFiles[1]
+	attributeFile = lambda name: graphStore.attributeFile(graphDirectory, name)
+	if newReviewFile is None:
+		weightMatrixStages = [
+			Stage('createBusinessWeightMatrix', createBusinessWeightMatrixStage, ["businessesWithSatisfiedUsers.csv"], ["weightMatrix.bin"],
+				{'businessesWithSatisfiedUsers': "businessesWithSatisfiedUsers.csv"})
+		]
+	else:
+		stateFiles = coReviewMatrix.coReviewStateFiles(stateDirectory)
+		#weightMatrix.bin is declared as read by the update so that it counts as updated in place after createBusinessWeightMatrix
+		weightMatrixStages = [
+			Stage('createBusinessWeightMatrix', createBusinessWeightMatrixStage, ["businessesWithSatisfiedUsers.csv"], ["weightMatrix.bin"] + stateFiles,
+				{'businessesWithSatisfiedUsers': "businessesWithSatisfiedUsers.csv", 'stateDirectory': stateDirectory}),
+			Stage('updateBusinessWeightMatrix', updateBusinessWeightMatrixStage, [newReviewFile, "weightMatrix.bin"] + stateFiles,
+				["weightMatrix.bin", "changedEdges.csv"], {'newReviewFile': newReviewFile, 'stateDirectory': stateDirectory})
+		]
+	return [
+		Stage('filterCity', filterCity.filter_city, [businessFile], ["filteredCity.csv"], {'csvFile': businessFile}),
+		Stage('filterBusinessesWithManyReviews', filterBusinessesWithManyReviews, ["filteredCity.csv"], ["sinaBusinessFile.csv"], {'csvFile': "filteredCity.csv"}),
+		Stage('filterByRating', filterByRatingStage, ["sinaBusinessFile.csv", reviewFile], ["sinaReviewFile.csv"],
+			{'businessFile': "sinaBusinessFile.csv", 'reviewFile': reviewFile}),
+		Stage('addColumnUsersWhichReviewed', addColumnUsersWhichReviewedStage, ["sinaReviewFile.csv", "sinaBusinessFile.csv"], ["businessesWithSatisfiedUsers.csv"],
+			{'reviewFile': "sinaReviewFile.csv", 'businessFile': "sinaBusinessFile.csv"})
+	] + weightMatrixStages + [
+		Stage('createGraphFromMatrix', createGraphFromMatrixStage, ["weightMatrix.bin"], graphFiles,
+			{'matrixFile': "weightMatrix.bin", 'graphDirectory': graphDirectory}),
+		Stage('addLocationAttributes', addLocationAttributes, [nodesFile, "businessesWithSatisfiedUsers.csv"], [attributeFile('latitude'), attributeFile('longitude')],
+			{'graphDirectory': graphDirectory, 'businessesWithSatisfiedUsers': "businessesWithSatisfiedUsers.csv"}),
+		Stage('addNameAttribute', addNameAttribute, [nodesFile, "sinaBusinessFile.csv"], [attributeFile('name')],
+			{'graphDirectory': graphDirectory, 'businessesWithManyReviews': "sinaBusinessFile.csv"}),
+		Stage('computeAverageGeographicalDistance', computeAverageGeographicalDistance, [nodesFile, attributeFile('latitude'), attributeFile('longitude')],
+			[attributeFile('averageDistance')], {'graphDirectory': graphDirectory}),
+		Stage('addCentralityAttributes', addCentralityAttributes, [nodesFile, "weightMatrix.bin"],
+			[attributeFile(name) for name in ['pagerank', 'weighted_degree', 'eigenvector', 'betweenness']] + ["centralities.npz"],
+			{'graphDirectory': graphDirectory, 'matrixFile': "weightMatrix.bin", 'previousCentralitiesFile': "centralities.npz",
+			'pagerankAlpha': centralityBackend.PAGERANK_ALPHA})
+	]
+
 if __name__ == '__main__':
+	#pipelineRunner.runPipeline(buildCentralityPipeline())
+
 	#businessesWithManyReviews = filterBusinessesWithManyReviews("filteredCity.csv")
 	#highRatedReviews = pd.read_csv("sinaReviewFile.csv")
 	#businessesWithManyReviews = pd.read_csv("sinaBusinessFile.csv")
 	#highRatedReviews = filterByRating(businessesWithManyReviews, 'review.csv')
 	#businessesWithSatisfiedUsersDf = addColumnUsersWhichReviewed(highRatedReviews, businessesWithManyReviews)
 	#createBusinessWeightMatrix(businessesWithSatisfiedUsersDf)
+	#updateBusinessWeightMatrix("newReviews.csv")
+	#pipelineRunner.runPipeline(buildCentralityPipeline(newReviewFile="newReviews.csv"))
 	
-	#loadedMatrix = loadMatrixFromTxt("weightMatrix.txt", 3126)
-	#createGraphFromMatrix(loadedMatrix, "businessesWithSatisfiedUsers.csv")
+	#matrixStore.convertTxtMatrix("weightMatrix.txt", "weightMatrix.bin", 3126, pd.read_csv("businessesWithSatisfiedUsers.csv", usecols=['business_id']).business_id.tolist())
+	#loadedMatrix, businessIds = loadMatrix("weightMatrix.bin")
+	#createGraphFromMatrix(loadedMatrix, businessIds)
 
-	G = loadGraphFromJson("jsonEnrichedGraph.json")
-	#addLocationAttributes(G, "businessesWithSatisfiedUsers.csv")
-	#addNameAttribute(G, "sinaBusinessFile.csv")
+	#graphStore.convertJsonGraph("jsonEnrichedGraph.json", "businessGraph")
+	#addLocationAttributes("businessGraph", "businessesWithSatisfiedUsers.csv")
+	#addNameAttribute("businessGraph", "sinaBusinessFile.csv")
+	#computeAverageGeographicalDistance("businessGraph")
+	#addCentralityAttributes("businessGraph", "weightMatrix.bin")
+	G = loadGraph("businessGraph")
 	#createSubGraphToVisualize(G)
-	#computeAverageGeographicalDistance(G)
 	#computePearsonCorrelation(G)
 	sortByWeights(G)
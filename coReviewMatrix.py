@@ -0,0 +1,196 @@
+import ast
+import os
+import numpy as np
+import pandas as pd
+from scipy import sparse
+import matrixStore
+
+
+def parseUserList(value):
+	if isinstance(value, (list, tuple, set, np.ndarray)):
+		return list(value)
+	if pd.isnull(value) or value == "":
+		return []
+	return ast.literal_eval(value)
+
+def buildIncidenceMatrix(userLists, userIndex=None):
+	#rows are businesses, columns are users; duplicate (business, user) pairs collapse to one entry
+	userLists = [parseUserList(users) for users in userLists]
+	userCounts = np.array([len(users) for users in userLists], dtype=np.float64)
+	flatUsers = [user for users in userLists for user in users]
+	rowIndices = np.repeat(np.arange(len(userLists)), userCounts.astype(np.int64))
+	if userIndex is None:
+		columnIndices, userIds = pd.factorize(pd.Series(flatUsers, dtype=object))
+	else:
+		userIds = pd.Index(userIndex)
+		columnIndices = userIds.get_indexer(flatUsers)
+		if (columnIndices < 0).any():
+			raise ValueError("satisfiedUsers contains user_ids missing from userIndex")
+	data = np.ones(len(flatUsers), dtype=np.float64)
+	incidence = sparse.csr_matrix((data, (rowIndices, columnIndices)), shape=(len(userLists), len(userIds)))
+	incidence.sum_duplicates()
+	incidence.data[:] = 1.
+	return incidence, userCounts, np.asarray(userIds)
+
+def buildIncidenceMatrixFromDataFrame(businessesWithSatisfiedUsers):
+	if not isinstance(businessesWithSatisfiedUsers, pd.DataFrame):
+		businessesWithSatisfiedUsers = pd.read_csv(businessesWithSatisfiedUsers)
+	incidence, userCounts, _ = buildIncidenceMatrix(businessesWithSatisfiedUsers.satisfiedUsers)
+	return incidence, userCounts, np.asarray(businessesWithSatisfiedUsers.business_id)
+
+def buildIncidenceMatrixFromReviews(reviewFile, businessIds=None):
+	#reviewFile is sinaReviewFile.csv (or its DataFrame): already restricted to >= 4 stars
+	if not isinstance(reviewFile, pd.DataFrame):
+		reviewFile = pd.read_csv(reviewFile, usecols=["user_id", "business_id"])
+	if businessIds is None:
+		rowIndices, businessIds = pd.factorize(reviewFile.business_id)
+	else:
+		businessIds = pd.Index(businessIds)
+		rowIndices = businessIds.get_indexer(reviewFile.business_id)
+		reviewFile = reviewFile[rowIndices >= 0]
+		rowIndices = rowIndices[rowIndices >= 0]
+	columnIndices, userIds = pd.factorize(reviewFile.user_id)
+	userCounts = np.bincount(rowIndices, minlength=len(businessIds)).astype(np.float64)
+	data = np.ones(len(rowIndices), dtype=np.float64)
+	incidence = sparse.csr_matrix((data, (rowIndices, columnIndices)), shape=(len(businessIds), len(userIds)))
+	incidence.sum_duplicates()
+	incidence.data[:] = 1.
+	return incidence, userCounts, np.asarray(businessIds)
+
+def overlapToWeights(rows, columns, overlap, userCounts):
+	#symmetric mean overlap: (|I&J|/|I| + |I&J|/|J|) / 2, empty businesses get weight 0
+	with np.errstate(divide='ignore', invalid='ignore'):
+		rowShare = np.where(userCounts[rows] > 0, overlap / userCounts[rows], 0.)
+		columnShare = np.where(userCounts[columns] > 0, overlap / userCounts[columns], 0.)
+	return (rowShare + columnShare) / 2.
+
+def computeOverlapWeights(incidence, userCounts=None, minOverlap=1, minWeight=0., blockSize=2048):
+	incidence = sparse.csr_matrix(incidence)
+	numberOfBusinesses = incidence.shape[0]
+	if userCounts is None:
+		userCounts = np.asarray(incidence.sum(axis=1)).ravel()
+	userCounts = np.asarray(userCounts, dtype=np.float64)
+	transposed = incidence.T.tocsc()
+	rowParts, columnParts, weightParts = [], [], []
+	#row blocks keep the intersection product bounded; pairs below the thresholds are dropped per block
+	for start in range(0, numberOfBusinesses, blockSize):
+		stop = min(start + blockSize, numberOfBusinesses)
+		blockOverlap = sparse.triu(incidence[start:stop].dot(transposed), k=start + 1).tocoo()
+		blockRows = blockOverlap.row + start
+		keep = blockOverlap.data >= max(minOverlap, 1)
+		blockRows, blockColumns, blockData = blockRows[keep], blockOverlap.col[keep], blockOverlap.data[keep]
+		blockWeights = overlapToWeights(blockRows, blockColumns, blockData, userCounts)
+		keep = blockWeights > minWeight
+		rowParts.append(blockRows[keep])
+		columnParts.append(blockColumns[keep])
+		weightParts.append(blockWeights[keep])
+	rows = np.concatenate(rowParts) if rowParts else np.zeros(0, dtype=np.int64)
+	columns = np.concatenate(columnParts) if columnParts else np.zeros(0, dtype=np.int64)
+	weights = np.concatenate(weightParts) if weightParts else np.zeros(0)
+	return sparse.csr_matrix((weights, (rows, columns)), shape=(numberOfBusinesses, numberOfBusinesses))
+
+def computeSparseWeightMatrix(businessesWithSatisfiedUsers, minOverlap=1, minWeight=0., blockSize=2048):
+	incidence, userCounts, businessIds = buildIncidenceMatrixFromDataFrame(businessesWithSatisfiedUsers)
+	weightMatrix = computeOverlapWeights(incidence, userCounts, minOverlap, minWeight, blockSize)
+	return weightMatrix, businessIds
+
+def computeSparseWeightMatrixFromReviews(reviewFile, businessIds=None, minOverlap=1, minWeight=0., blockSize=2048):
+	incidence, userCounts, businessIds = buildIncidenceMatrixFromReviews(reviewFile, businessIds)
+	weightMatrix = computeOverlapWeights(incidence, userCounts, minOverlap, minWeight, blockSize)
+	return weightMatrix, businessIds
+
+
+class CoReviewState(object):
+	#the business x user incidence, per-business satisfied-user counts and the current weights, updatable with new reviews
+
+	def __init__(self, incidence, userCounts, businessIds, userIds, weightMatrix, minOverlap=1, minWeight=0.):
+		self.incidence = sparse.csr_matrix(incidence)
+		self.userCounts = np.asarray(userCounts, dtype=np.float64)
+		self.businessIds = np.asarray(businessIds, dtype=object)
+		self.userIds = np.asarray(userIds, dtype=object)
+		self.weightMatrix = sparse.csr_matrix(weightMatrix)
+		self.minOverlap = minOverlap
+		self.minWeight = minWeight
+		self.businessIndex = pd.Index(self.businessIds)
+		self.userIndex = dict((userId, i) for i, userId in enumerate(self.userIds.tolist()))
+
+	def addUsers(self, userIds):
+		newUsers = [userId for userId in pd.unique(np.asarray(userIds, dtype=object)) if userId not in self.userIndex]
+		for userId in newUsers:
+			self.userIndex[userId] = len(self.userIndex)
+		if newUsers:
+			self.userIds = np.concatenate([self.userIds, np.asarray(newUsers, dtype=object)])
+			self.incidence = sparse.csr_matrix((self.incidence.data, self.incidence.indices, self.incidence.indptr),
+				shape=(len(self.businessIds), len(self.userIds)))
+
+	def applyReviews(self, newReviews):
+		#newReviews holds (user_id, business_id) rows of new high-star reviews; rows for unknown businesses are ignored
+		rowIndices = self.businessIndex.get_indexer(newReviews.business_id)
+		newReviews = newReviews[rowIndices >= 0]
+		rowIndices = rowIndices[rowIndices >= 0]
+		if len(newReviews) == 0:
+			return pd.DataFrame(columns=['business_id_a', 'business_id_b', 'oldWeight', 'newWeight'])
+		self.addUsers(newReviews.user_id)
+		columnIndices = np.array([self.userIndex[userId] for userId in newReviews.user_id], dtype=np.int64)
+		delta = sparse.csr_matrix((np.ones(len(rowIndices)), (rowIndices, columnIndices)), shape=self.incidence.shape)
+		self.incidence = (self.incidence + delta).tocsr()
+		self.incidence.data[:] = 1.
+		self.userCounts += np.bincount(rowIndices, minlength=len(self.businessIds))
+		#only pairs touching a business with new reviews can change: their overlaps are recomputed row by row
+		affected = np.unique(rowIndices)
+		affectedOverlap = self.incidence[affected].dot(self.incidence.T).tocoo()
+		isAffected = np.zeros(len(self.businessIds), dtype=bool)
+		isAffected[affected] = True
+		rows, columns, overlap = affected[affectedOverlap.row], affectedOverlap.col, affectedOverlap.data
+		#a pair of two affected businesses shows up in both of their rows; keep it once
+		keep = (rows != columns) & (overlap >= max(self.minOverlap, 1)) & ~(isAffected[columns] & (columns < rows))
+		rows, columns, overlap = rows[keep], columns[keep], overlap[keep]
+		upperRows, upperColumns = np.minimum(rows, columns), np.maximum(rows, columns)
+		weights = overlapToWeights(upperRows, upperColumns, overlap, self.userCounts)
+		keep = weights > self.minWeight
+		newWeights = sparse.csr_matrix((weights[keep], (upperRows[keep], upperColumns[keep])), shape=self.weightMatrix.shape)
+		oldWeights = self.weightMatrix.tocoo()
+		touched = isAffected[oldWeights.row] | isAffected[oldWeights.col]
+		untouchedWeights = sparse.csr_matrix((oldWeights.data[~touched], (oldWeights.row[~touched], oldWeights.col[~touched])), shape=self.weightMatrix.shape)
+		touchedWeights = sparse.csr_matrix((oldWeights.data[touched], (oldWeights.row[touched], oldWeights.col[touched])), shape=self.weightMatrix.shape)
+		self.weightMatrix = (untouchedWeights + newWeights).tocsr()
+		return changedEdges(touchedWeights, newWeights, self.businessIds)
+
+	def save(self, directory):
+		if not os.path.isdir(directory):
+			os.makedirs(directory)
+		sparse.save_npz(os.path.join(directory, "incidence.npz"), self.incidence)
+		np.savez(os.path.join(directory, "state.npz"), userCounts=self.userCounts, businessIds=self.businessIds.astype(str),
+			userIds=self.userIds.astype(str), thresholds=np.array([self.minOverlap, self.minWeight], dtype=np.float64))
+		matrixStore.saveWeightMatrix(os.path.join(directory, "weightMatrix.bin"), self.weightMatrix, self.businessIds)
+
+
+def changedEdges(oldWeights, newWeights, businessIds):
+	difference = (newWeights - oldWeights).tocoo()
+	changed = difference.data != 0
+	rows, columns = difference.row[changed], difference.col[changed]
+	oldWeights = sparse.csr_matrix(oldWeights)
+	newWeights = sparse.csr_matrix(newWeights)
+	return pd.DataFrame({
+		'business_id_a': businessIds[rows],
+		'business_id_b': businessIds[columns],
+		'oldWeight': np.asarray(oldWeights[rows, columns]).ravel(),
+		'newWeight': np.asarray(newWeights[rows, columns]).ravel()
+	}, columns=['business_id_a', 'business_id_b', 'oldWeight', 'newWeight'])
+
+def coReviewStateFiles(directory):
+	return [os.path.join(directory, name) for name in ["incidence.npz", "state.npz", "weightMatrix.bin"]]
+
+def buildCoReviewState(businessesWithSatisfiedUsers, minOverlap=1, minWeight=0.):
+	if not isinstance(businessesWithSatisfiedUsers, pd.DataFrame):
+		businessesWithSatisfiedUsers = pd.read_csv(businessesWithSatisfiedUsers)
+	incidence, userCounts, userIds = buildIncidenceMatrix(businessesWithSatisfiedUsers.satisfiedUsers)
+	weightMatrix = computeOverlapWeights(incidence, userCounts, minOverlap, minWeight)
+	return CoReviewState(incidence, userCounts, businessesWithSatisfiedUsers.business_id, userIds, weightMatrix, minOverlap, minWeight)
+
+def loadCoReviewState(directory):
+	state = np.load(os.path.join(directory, "state.npz"))
+	weightMatrix, businessIds = matrixStore.loadWeightMatrix(os.path.join(directory, "weightMatrix.bin"))
+	minOverlap, minWeight = state['thresholds']
+	return CoReviewState(sparse.load_npz(os.path.join(directory, "incidence.npz")), state['userCounts'], state['businessIds'].tolist(),
+		state['userIds'].tolist(), sparse.csr_matrix(weightMatrix), minOverlap, minWeight)
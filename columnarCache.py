@@ -0,0 +1,136 @@
+import json
+import os
+import tempfile
+import warnings
+import pandas as pd
+try:
+	import pyarrow as pa
+	import pyarrow.parquet as pq
+except ImportError:
+	pa = None
+	pq = None
+
+CACHE_DIRECTORY = ".columnarCache"
+CONVERSION_CHUNK_SIZE = 500000
+
+
+def isAvailable():
+	return pq is not None
+
+def cachePaths(fileName, cacheDirectory=None):
+	if cacheDirectory is None:
+		cacheDirectory = os.path.join(os.path.dirname(os.path.abspath(fileName)), CACHE_DIRECTORY)
+	baseName = os.path.basename(fileName)
+	return os.path.join(cacheDirectory, baseName + ".parquet"), os.path.join(cacheDirectory, baseName + ".json")
+
+def sourceSignature(fileName):
+	fileStat = os.stat(fileName)
+	return {"source": os.path.abspath(fileName), "size": fileStat.st_size, "mtime": fileStat.st_mtime}
+
+def isCacheCurrent(fileName, cacheDirectory=None):
+	parquetPath, metadataPath = cachePaths(fileName, cacheDirectory)
+	if not (os.path.exists(parquetPath) and os.path.exists(metadataPath)):
+		return False
+	with open(metadataPath) as metadataFile:
+		return json.load(metadataFile) == json.loads(json.dumps(sourceSignature(fileName)))
+
+def chunkSchema(chunk):
+	#all-null object columns in the first chunk would otherwise be typed as null and reject later strings
+	schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+	fields = [pa.field(field.name, pa.string()) if field.type == pa.null() else field for field in schema]
+	return pa.schema(fields)
+
+def columnTypes(fileName, chunkSize=CONVERSION_CHUNK_SIZE):
+	#a first full pass: a column read as text in any chunk stays text (postal codes, ids that look numeric in some chunks),
+	#and an int column that is float elsewhere because of NaN becomes float
+	kinds = {}
+	for chunk in pd.read_csv(fileName, chunksize=chunkSize):
+		for column in chunk.columns:
+			kinds.setdefault(column, set()).add(chunk[column].dtype.kind)
+	types = {}
+	for column, columnKinds in kinds.items():
+		if len(columnKinds) == 1 and columnKinds <= set('biuf'):
+			continue
+		types[column] = float if columnKinds <= set('iuf') else str
+	return types
+
+def makeDirectory(directory):
+	#several workers may create it at once
+	try:
+		os.makedirs(directory)
+	except OSError:
+		if not os.path.isdir(directory):
+			raise
+
+def temporaryFile(path):
+	#unique per call, so workers converting the same CSV at once never write into each other's file; renamed over path when done
+	descriptor, temporaryPath = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + ".", suffix=".tmp")
+	os.close(descriptor)
+	return temporaryPath
+
+def convertToParquet(fileName, cacheDirectory=None, chunkSize=CONVERSION_CHUNK_SIZE):
+	parquetPath, metadataPath = cachePaths(fileName, cacheDirectory)
+	makeDirectory(os.path.dirname(parquetPath))
+	signature = sourceSignature(fileName)
+	temporaryPath = temporaryFile(parquetPath)
+	writer = None
+	try:
+		for chunk in pd.read_csv(fileName, chunksize=chunkSize, dtype=columnTypes(fileName, chunkSize)):
+			if writer is None:
+				schema = chunkSchema(chunk)
+				writer = pq.ParquetWriter(temporaryPath, schema)
+			writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+	except Exception:
+		if writer is not None:
+			writer.close()
+		os.remove(temporaryPath)
+		raise
+	if writer is None:
+		os.remove(temporaryPath)
+		return None
+	writer.close()
+	os.rename(temporaryPath, parquetPath)
+	temporaryMetadataPath = temporaryFile(metadataPath)
+	with open(temporaryMetadataPath, "w") as metadataFile:
+		json.dump(signature, metadataFile)
+	os.rename(temporaryMetadataPath, metadataPath)
+	return parquetPath
+
+def ensureCache(fileName, cacheDirectory=None):
+	#(re)builds the Parquet copy when the source CSV's size or mtime no longer matches the recorded one
+	if not isCacheCurrent(fileName, cacheDirectory):
+		return convertToParquet(fileName, cacheDirectory)
+	return cachePaths(fileName, cacheDirectory)[0]
+
+def invalidate(fileName, cacheDirectory=None):
+	for path in cachePaths(fileName, cacheDirectory):
+		if os.path.exists(path):
+			os.remove(path)
+
+def cachedParquet(fileName, cacheDirectory=None):
+	#None when the CSV cannot be cached, so callers read it directly instead of failing
+	if not isAvailable():
+		return None
+	try:
+		return ensureCache(fileName, cacheDirectory)
+	except (ValueError, TypeError, pa.ArrowException) as error:
+		warnings.warn("not caching %s as Parquet, reading the CSV directly: %s" % (fileName, error))
+		return None
+
+def readColumnar(fileName, columns=None, cacheDirectory=None):
+	parquetPath = cachedParquet(fileName, cacheDirectory)
+	if parquetPath is None:
+		return pd.read_csv(fileName, usecols=columns)
+	return pq.read_table(parquetPath, columns=columns).to_pandas()
+
+def readColumnarChunks(fileName, columns=None, chunkSize=CONVERSION_CHUNK_SIZE, cacheDirectory=None):
+	parquetPath = cachedParquet(fileName, cacheDirectory)
+	if parquetPath is None:
+		for chunk in pd.read_csv(fileName, usecols=columns, chunksize=chunkSize):
+			yield chunk
+		return
+	parquetFile = pq.ParquetFile(parquetPath)
+	for rowGroup in range(parquetFile.num_row_groups):
+		rowGroupFrame = parquetFile.read_row_group(rowGroup, columns=columns).to_pandas()
+		for start in range(0, len(rowGroupFrame), chunkSize):
+			yield rowGroupFrame.iloc[start:start + chunkSize].reset_index(drop=True)
@@ -0,0 +1,74 @@
+import pandas as pd
+from pandas.api.types import union_categoricals
+import columnarCache
+
+DEFAULT_CHUNK_SIZE = 500000
+COLUMN_DTYPES = {
+	'user_id': 'category',
+	'business_id': 'category',
+	'review_id': 'category',
+	'useful': 'int32',
+	'funny': 'int32',
+	'cool': 'int32',
+	'likes': 'int32'
+}
+DATE_COLUMNS = ['date']
+
+
+def columnDtypes(columns):
+	if columns is None:
+		return dict(COLUMN_DTYPES)
+	return dict((column, dtype) for column, dtype in COLUMN_DTYPES.items() if column in columns)
+
+def readChunks(fileName, columns=None, predicate=None, chunkSize=DEFAULT_CHUNK_SIZE, parseDates=True, dtypes=None, useCache=True):
+	#yields DataFrames of at most chunkSize rows; predicate(chunk) returns a boolean mask applied before the chunk is yielded
+	dtype = columnDtypes(columns)
+	if dtypes is not None:
+		dtype.update(dtypes)
+	useCache = useCache and columnarCache.isAvailable()
+	if useCache:
+		reader = columnarCache.readColumnarChunks(fileName, columns, chunkSize)
+	else:
+		reader = pd.read_csv(fileName, usecols=columns, dtype=dtype, chunksize=chunkSize)
+	for chunk in reader:
+		if useCache:
+			chunk = chunk.astype(dict((column, columnType) for column, columnType in dtype.items() if column in chunk.columns))
+		if parseDates:
+			for column in DATE_COLUMNS:
+				if column in chunk.columns:
+					chunk[column] = pd.to_datetime(chunk[column])
+		if predicate is not None:
+			chunk = chunk[predicate(chunk)]
+			for column in chunk.columns:
+				if isinstance(chunk[column].dtype, pd.CategoricalDtype):
+					chunk[column] = chunk[column].cat.remove_unused_categories()
+		if len(chunk) > 0:
+			yield chunk
+
+def concatChunks(chunks, columns=None):
+	#categorical columns get the union of every chunk's categories instead of falling back to object
+	chunks = list(chunks)
+	if not chunks:
+		return pd.DataFrame(columns=columns)
+	combined = pd.concat(chunks, ignore_index=True)
+	for column in chunks[0].columns:
+		if all(isinstance(chunk[column].dtype, pd.CategoricalDtype) for chunk in chunks):
+			combined[column] = union_categoricals([chunk[column] for chunk in chunks])
+	return combined
+
+def filterCsv(fileName, columns=None, predicate=None, chunkSize=DEFAULT_CHUNK_SIZE, parseDates=True, dtypes=None, useCache=True):
+	chunks = readChunks(fileName, columns, predicate, chunkSize, parseDates, dtypes, useCache)
+	return concatChunks(chunks, columns)
+
+def isInColumn(column, values):
+	values = set(values)
+	return lambda chunk: chunk[column].isin(values)
+
+def countByColumn(fileName, column, chunkSize=DEFAULT_CHUNK_SIZE, useCache=True):
+	counts = None
+	for chunk in readChunks(fileName, [column], chunkSize=chunkSize, parseDates=False, dtypes={column: object}, useCache=useCache):
+		chunkCounts = chunk[column].value_counts()
+		counts = chunkCounts if counts is None else counts.add(chunkCounts, fill_value=0)
+	if counts is None:
+		return pd.Series([], dtype='int64')
+	return counts.astype('int64')
@@ -4,28 +4,21 @@ import operator
 import datetime
 import numpy as np
 import ast
-from joblib import Parallel, delayed
-import multiprocessing
 from six.moves import cPickle as pickle
 import threading
+import csvStream
+import friendGraph
+import influence
+import featureExecutor
+import instrumentation
+import pipelineRunner
 
 
+@instrumentation.instrumented
 def getMostReviewedBusinesses(reviewFile, tipFile):
-	reviewFile = pd.read_csv(reviewFile, usecols=["user_id", "business_id", "date"])
-	tipFile = pd.read_csv(tipFile, usecols=["user_id", "business_id", "date"])
-	allBusiness_IDs = {}
-	for i in range (len(reviewFile.business_id)):
-		currentID = reviewFile.business_id[i]
-		if(currentID not in allBusiness_IDs):
-			allBusiness_IDs[currentID] = 1
-		else:
-			allBusiness_IDs[currentID] += 1
-	for i in range (len(tipFile.business_id)):
-		currentID = tipFile.business_id[i]
-		if(currentID not in allBusiness_IDs):
-			allBusiness_IDs[currentID] = 1 
-		else:
-			allBusiness_IDs[currentID] += 1
+	allBusiness_IDs = csvStream.countByColumn(reviewFile, 'business_id')
+	allBusiness_IDs = allBusiness_IDs.add(csvStream.countByColumn(tipFile, 'business_id'), fill_value=0).astype('int64')
+	allBusiness_IDs = dict(allBusiness_IDs.items())
 	
 	sorted_businesses = list(sorted(allBusiness_IDs.items(), key = operator.itemgetter(1)))
 	writeToFile("sorted_businesses", sorted_businesses)
@@ -37,37 +30,59 @@ def extractUsersReviewingImportantBusinesses(business_id):
 	targetFilename = "usersReviewingImportantBusinesses_"+ business_id + ".csv"
 	writeToFile(targetFilename, list(reviewingUsers.items()))
 
+@instrumentation.instrumented
+def extractUsersReviewingImportantBusinessesBatch(business_ids, reviewFile="review.csv", tipFile="tip.csv"):
+	#one scan of each file for any number of businesses; only each user's earliest review and tip are kept in memory
+	columns = ["user_id", "business_id", "date", "text"]
+	earliestRows = {}
+	for fileName in [reviewFile, tipFile]:
+		earliestRows[fileName] = dict((business_id, None) for business_id in business_ids)
+		for chunk in csvStream.readChunks(fileName, columns, csvStream.isInColumn('business_id', business_ids), parseDates=False):
+			for business_id, businessRows in chunk.groupby('business_id', sort=False, observed=True):
+				earliestRows[fileName][business_id] = earliestPerUser(businessRows, earliestRows[fileName][business_id])
+	for business_id in business_ids:
+		firstComments = computeFirstComments(earliestRows[reviewFile][business_id], earliestRows[tipFile][business_id])
+		targetFilename = "usersReviewingImportantBusinesses_"+ business_id + ".csv"
+		writeToFile(targetFilename, firstCommentsToItems(firstComments))
+
+def earliestPerUser(rows, previousEarliest=None):
+	#one row per user_id with the earliest date; on equal dates the row seen first wins, previously kept rows included
+	rows = rows[["user_id", "date", "text"]].assign(user_id=rows.user_id.astype(str))
+	rows['parsedDate'] = pd.to_datetime(rows.date, format="%Y-%m-%d")
+	if previousEarliest is not None:
+		rows = pd.concat([previousEarliest, rows], ignore_index=True)
+	rows = rows.sort_values('parsedDate', kind='mergesort')
+	return rows.drop_duplicates('user_id', keep='first')
+
+@instrumentation.instrumented
+def computeFirstComments(filteredReviews, filteredTips):
+	#the commentText is the earliest tip's text when the user left a tip, the earliest review's text otherwise
+	emptyRows = pd.DataFrame({"user_id": [], "date": [], "text": []})
+	firstReviews = earliestPerUser(filteredReviews if filteredReviews is not None else emptyRows)
+	firstTips = earliestPerUser(filteredTips if filteredTips is not None else emptyRows)
+	firstReviews = firstReviews.rename(columns={"date": "reviewDate", "text": "reviewText", "parsedDate": "reviewParsedDate"})
+	firstTips = firstTips.rename(columns={"date": "tipDate", "text": "tipText", "parsedDate": "tipParsedDate"})
+	firstComments = firstReviews.merge(firstTips, on="user_id", how="outer")
+	hasTip = firstComments.tipParsedDate.notnull()
+	firstComments['commentText'] = firstComments.tipText.where(hasTip, firstComments.reviewText)
+	tipIsFirst = hasTip & ~(firstComments.reviewParsedDate <= firstComments.tipParsedDate)
+	firstComments['firstComment'] = firstComments.tipParsedDate.where(tipIsFirst, firstComments.reviewParsedDate).dt.strftime("%Y-%m-%d")
+	firstComments['reviewDate'] = firstComments.reviewDate.fillna("")
+	firstComments['tipDate'] = firstComments.tipDate.fillna("")
+	return firstComments[["user_id", "reviewDate", "tipDate", "reviewText", "tipText", "commentText", "firstComment"]].reset_index(drop=True)
+
+def firstCommentsToItems(firstComments):
+	return list(zip(firstComments.user_id, zip(firstComments.reviewDate, firstComments.tipDate, firstComments.commentText)))
+
 def getDatesOfFirstComment(filteredReviews, filteredTips):
-	reviewingUsers = {}
-	for i in range (len(filteredReviews.user_id)):
-		currentID = filteredReviews.user_id[i]
-		currentDate = filteredReviews.date[i]
-		reviewText = filteredReviews.text[i]
-		dateOfReview = datetime.datetime.strptime(currentDate, "%Y-%m-%d")
-		if currentID not in reviewingUsers:
-			reviewingUsers[currentID] = [currentDate, "", reviewText]
-		elif(dateOfReview < datetime.datetime.strptime(reviewingUsers[currentID][0], "%Y-%m-%d")):
-			reviewingUsers[currentID] = [currentDate, "", reviewText]
-	for i in range(len(filteredTips.user_id)):
-		currentID = filteredTips.user_id[i]
-		currentDate = filteredTips.date[i]
-		tipText = filteredTips.text[i]
-		dateOfReview = datetime.datetime.strptime(currentDate, "%Y-%m-%d")
-		if currentID not in reviewingUsers:
-			reviewingUsers[currentID] = ["", currentDate, tipText]
-		elif (not reviewingUsers[currentID][1]) or (dateOfReview < datetime.datetime.strptime(reviewingUsers[currentID][1], "%Y-%m-%d")):
-			reviewingUsers[currentID][1] = currentDate
-			reviewingUsers[currentID][2] = tipText
-	return reviewingUsers
+	firstComments = computeFirstComments(filteredReviews, filteredTips)
+	return dict((user_id, list(values)) for user_id, values in firstCommentsToItems(firstComments))
 
 def filterReviewAndTipFilesByBusinessId(business_id):
-	reviewFile = pd.read_csv("review.csv", usecols=["user_id", "business_id", "date", "text"])
-	tipFile = pd.read_csv("tip.csv", usecols=["user_id", "business_id", "date", "text"])
+	columns = ["user_id", "business_id", "date", "text"]
 	business_list = [business_id]
-	reviewDf = reviewFile[reviewFile['business_id'].isin(business_list)]
-	reviewDf = reviewDf.reset_index(drop=True)	
-	tipDf = tipFile[tipFile['business_id'].isin(business_list)]
-	tipDf = tipDf.reset_index(drop = True)
+	reviewDf = csvStream.filterCsv("review.csv", columns, csvStream.isInColumn('business_id', business_list), parseDates=False)
+	tipDf = csvStream.filterCsv("tip.csv", columns, csvStream.isInColumn('business_id', business_list), parseDates=False)
 	return reviewDf, tipDf
 
 def addFirstCommentTextColumn(fileName, business_id):
@@ -78,35 +93,25 @@ def addFirstCommentTextColumn(fileName, business_id):
 	csvDataFrame.to_csv(fileName, index=False)
 
 
-def fillListOfInfluencedUsers(i, usersDic, usersReviewingImportantBusinesses):
-	listOfFriends = ast.literal_eval(usersDic[usersReviewingImportantBusinesses.user_id[i]])
-	firstComment = getFirstCommentOfUser(usersReviewingImportantBusinesses.reviewDate[i], usersReviewingImportantBusinesses.tipDate[i])
-	usersWhichCommentedAfter = getListOfUsersWhoCommentedAfter(listOfFriends, firstComment, usersReviewingImportantBusinesses)
-	return usersWhichCommentedAfter
-
-
-def addUsersWhichCommentedAfter(fileName, usersDic):
+@instrumentation.instrumented
+def addUsersWhichCommentedAfter(fileName, friends=None):
 	csv.field_size_limit(1000000)
 	usersReviewingImportantBusinesses = pd.read_csv(fileName)
-	friendsWhichCommentedAfter = ["" for x in range(len(usersReviewingImportantBusinesses.user_id))]
-	#usersDic = getUsersDictionary()
-	#usersDic = load_dict('userDicFile')
-	
-	for i in range(len(usersReviewingImportantBusinesses.user_id)):
-		listOfAllFriends = usersReviewingImportantBusinesses.allFriends[i]
-		usersWhichCommentedAfter = getListOfUsersWhoCommentedAfter(listOfAllFriends, usersReviewingImportantBusinesses, i)
-		friendsWhichCommentedAfter[i] = usersWhichCommentedAfter
-	
-	# num_cores = multiprocessing.cpu_count()
-	# friendsWhichCommentedAfter = Parallel(n_jobs = num_cores)(delayed(fillListOfInfluencedUsers)(i, usersDic, usersReviewingImportantBusinesses) for i in range(len(usersReviewingImportantBusinesses.user_id)))
-	
+	if friends is None:
+		friends = friendGraph.getFriendGraph()
+	friendsWhichCommentedAfter = influence.computeFriendsWhoCommentedAfter(usersReviewingImportantBusinesses.user_id,
+		usersReviewingImportantBusinesses.firstComment, friends)
 	usersReviewingImportantBusinesses['friendsWhichCommentedAfter'] = friendsWhichCommentedAfter
 	usersReviewingImportantBusinesses.to_csv(fileName, index=False)
+	instrumentation.addOutputFile(fileName)
 
 def getListOfUsersWhoCommentedAfter(listOfAllFriends, usersReviewingImportantBusinesses, indexPosition):
+	if isinstance(listOfAllFriends, str):
+		listOfAllFriends = ast.literal_eval(listOfAllFriends)
+	listOfAllFriends = set(listOfAllFriends)
 	listOfFriendsWhoCommentedAfter = []
-	usersWhichCommentedAfter = list(usersReviewingImportantBusinesses.iloc[indexPosition:, 0])
-	usersWhichCommentedAfterDate = list(usersReviewingImportantBusinesses.iloc[indexPosition:, 3])
+	usersWhichCommentedAfter = usersReviewingImportantBusinesses.user_id.values[indexPosition:]
+	usersWhichCommentedAfterDate = usersReviewingImportantBusinesses.firstComment.values[indexPosition:]
 	for i in range(len(usersWhichCommentedAfter)):
 		currentID = str(usersWhichCommentedAfter[i])
 		if(currentID in listOfAllFriends):
@@ -116,15 +121,15 @@ def getListOfUsersWhoCommentedAfter(listOfAllFriends, usersReviewingImportantBus
 			listOfFriendsWhoCommentedAfter.append(influencedFriendsDict)
 	return listOfFriendsWhoCommentedAfter
 
+@instrumentation.instrumented
 def addFirstCommentColumn(csvFile):
 	fileName = csvFile
 	csvFile = pd.read_csv(csvFile)
-	firstCommentDateList = ["" for x in range(len(csvFile.user_id))]
-	for i in range(len(csvFile.user_id)):
-		firstCommentDateList[i] = getFirstCommentOfUser(csvFile.reviewDate[i], csvFile.tipDate[i])
-		firstCommentDateList[i] = firstCommentDateList[i].strftime("%Y-%m-%d")
-	csvFile['firstComment'] = firstCommentDateList
+	reviewDates = pd.to_datetime(csvFile.reviewDate, format="%Y-%m-%d")
+	tipDates = pd.to_datetime(csvFile.tipDate, format="%Y-%m-%d")
+	csvFile['firstComment'] = reviewDates.where(~(tipDates < reviewDates) & reviewDates.notnull(), tipDates).dt.strftime("%Y-%m-%d")
 	csvFile.to_csv(fileName, index=False)
+	instrumentation.addOutputFile(fileName)
 
 def getUsersDictionary():
 	usersDic = {}
@@ -142,23 +147,61 @@ def getFirstCommentOfUser(reviewDate, tipDate):
 		firstComment = datetime.datetime.strptime(tipDate, "%Y-%m-%d")
 	return firstComment
 
-def addRatioOfInfluencedFriends(usersReviewingImportantBusinesses):
-	csv.field_size_limit(1000000)
+@instrumentation.instrumented
+def addRatioOfInfluencedFriends(usersReviewingImportantBusinesses, outputFile=None):
+	#writes back to the input file unless outputFile is given
+	fileName = usersReviewingImportantBusinesses
 	usersReviewingImportantBusinesses = pd.read_csv(usersReviewingImportantBusinesses)
-	usersDic = getUsersDictionary()
-	influencedFriendsRatio = ["" for x in range(len(usersReviewingImportantBusinesses.user_id))]
-	totalFriends = ["" for x in range(len(usersReviewingImportantBusinesses.user_id))]
-	for i in range(len(usersReviewingImportantBusinesses.user_id)):
-		listOfFriends = ast.literal_eval(usersDic[usersReviewingImportantBusinesses.user_id[i]])	
-		totalFriends[i] = len(listOfFriends)
-		influencedFriends = len(ast.literal_eval(usersReviewingImportantBusinesses.friendsWhichCommentedAfter[i]))
-		if (len(listOfFriends) > 0):
-			influencedFriendsRatio[i] = influencedFriends / float(len(listOfFriends))
-		else:
-			influencedFriendsRatio[i] = 0
+	friends = friendGraph.getFriendGraph()
+	totalFriends = friends.degree(usersReviewingImportantBusinesses.user_id)
+	#friendsWhichCommentedAfter holds one {user_id: date} dict per friend, so counting braces counts friends
+	influencedFriends = usersReviewingImportantBusinesses.friendsWhichCommentedAfter.fillna("").astype(str).str.count(r"\{").values
+	with np.errstate(divide='ignore', invalid='ignore'):
+		influencedFriendsRatio = np.where(totalFriends > 0, influencedFriends / totalFriends.astype(np.float64), 0)
 	usersReviewingImportantBusinesses['totalFriends'] = totalFriends
 	usersReviewingImportantBusinesses['influencedFriendsRatio'] = influencedFriendsRatio
-	usersReviewingImportantBusinesses.to_csv('usersReviewingImportantBusinesses.csv', index=False)
+	usersReviewingImportantBusinesses.to_csv(outputFile or fileName, index=False)
+	instrumentation.addOutputFile(outputFile or fileName)
+
+@instrumentation.instrumented
+def computeInfluenceForBusinesses(business_ids=None, reviewFile="review.csv", tipFile="tip.csv", outputFile="friendInfluence.csv", friends=None):
+	#influenced-friend counts and ratios of every (user, business) first comment, for all businesses (business_ids=None) at once
+	if friends is None:
+		friends = friendGraph.getFriendGraph()
+	firstComments = influence.firstCommentTimes(reviewFile, tipFile, business_ids)
+	influencedFriends = influence.computeInfluence(firstComments, friends)
+	influencedFriends.to_csv(outputFile, index=False)
+	return influencedFriends
+
+def buildFriendGraphStage(userFile, directory):
+	friendGraph.buildFriendGraph(userFile).save(directory)
+
+def firstCommentFile(business_id):
+	return "usersReviewingImportantBusinesses_" + business_id + ".csv"
+
+def buildFeaturePipeline(business_ids, reviewFile="review.csv", tipFile="tip.csv", userFile="user.csv"):
+	#each business file is updated in place by a chain of stages; the chains of different businesses run in parallel
+	Stage = pipelineRunner.Stage
+	friendFiles = friendGraph.friendGraphFiles()
+	stages = [
+		Stage('buildFriendGraph', buildFriendGraphStage, [userFile], friendFiles,
+			{'userFile': userFile, 'directory': friendGraph.FRIEND_GRAPH_DIRECTORY}),
+		Stage('extractUsersReviewingImportantBusinesses', extractUsersReviewingImportantBusinessesBatch, [reviewFile, tipFile],
+			[firstCommentFile(business_id) for business_id in business_ids], {'business_ids': list(business_ids), 'reviewFile': reviewFile, 'tipFile': tipFile})
+	]
+	for business_id in business_ids:
+		fileName = firstCommentFile(business_id)
+		stages += [
+			Stage('addFirstCommentColumn_' + business_id, addFirstCommentColumn, [fileName], [fileName], {'csvFile': fileName}),
+			Stage('sortByFirstComment_' + business_id, sortByFirstComment, [fileName], [fileName], {'csvFile': fileName}),
+			Stage('addFriendsColumn_' + business_id, addFriendsColumn, [fileName] + friendFiles, [fileName], {'csvFile': fileName}),
+			Stage('addUsersWhichCommentedAfter_' + business_id, addUsersWhichCommentedAfter, [fileName] + friendFiles, [fileName], {'fileName': fileName}),
+			Stage('addRatioOfInfluencedFriends_' + business_id, addRatioOfInfluencedFriends, [fileName] + friendFiles, [fileName],
+				{'usersReviewingImportantBusinesses': fileName})
+		]
+	stages.append(Stage('computeInfluenceForBusinesses', computeInfluenceForBusinesses, [reviewFile, tipFile] + friendFiles, ["friendInfluence.csv"],
+		{'business_ids': list(business_ids), 'reviewFile': reviewFile, 'tipFile': tipFile, 'outputFile': "friendInfluence.csv"}))
+	return stages
 
 def writeToFile(filename, values):
 	with open(filename, "wb") as myfile:
@@ -169,24 +212,23 @@ def writeToFile(filename, values):
 			wr.writerow([values[i][0], values[i][1][0], values[i][1][1], values[i][1][2]])
 	myfile.close()	
 
+@instrumentation.instrumented
 def sortByFirstComment(csvFile):
 	csvDataFrame = pd.read_csv(csvFile)
 	csvDataFrame['firstComment'] = pd.to_datetime(csvDataFrame.firstComment)
 	sortedDF = csvDataFrame.sort_values('firstComment')
 	sortedDF.to_csv(csvFile, index=False)
+	instrumentation.addOutputFile(csvFile)
 
+@instrumentation.instrumented
 def addFriendsColumn(csvFile):
 	csv.field_size_limit(1000000)
 	csvDataFrame = pd.read_csv(csvFile)
-	allFriends = [[] for x in range(len(csvDataFrame.user_id))]
-	#usersDic = getUsersDictionary()
-	#save_dict(usersDic, 'userDicFile')
-	usersDic = load_dict('userDicFile')
-	for i in range(len(csvDataFrame.user_id)):
-		listOfFriends = ast.literal_eval(usersDic[csvDataFrame.user_id[i]])	
-		allFriends[i] = listOfFriends
+	friends = friendGraph.getFriendGraph()
+	allFriends = [friends.friendsOf(user_id) for user_id in csvDataFrame.user_id]
 	csvDataFrame['allFriends'] = allFriends
 	csvDataFrame.to_csv(csvFile, index=False)	
+	instrumentation.addOutputFile(csvFile)
 
 def save_dict(di_, filename_):
     with open(filename_, 'wb') as f:
@@ -213,22 +255,12 @@ if __name__ == '__main__':
 	
 	most_popular_business_id = ["4JNXUYY8wbaaDmk3BPzlWw", "cYwJA2A6I12KNkm2rtXd5g"]#["f4x1YBxkLrZg652xt2KR5g"]
 	averagely_popular_business_id = ["wUKzaS1MHg94RGM6z8u9mw", "r_BrIgzYcwo1NAuG9dLbpg", "JLbgvGM4FXh9zNP4O5ZWjQ", "YPavuOh2XsnRbLfl0DH2lQ", "L2p0vO3fsS2LC6hhQo3CzA"]
-	#usersDict = load_dict('userDicFile')
-	
-	processes = []
-	for business_id in most_popular_business_id:
-		fileName = "usersReviewingImportantBusinesses_" + business_id + ".csv"
-		#t = multiprocessing.Process(target = extractUsersReviewingImportantBusinesses, args=(business_id, ))
-		#t = multiprocessing.Process(target = addFirstCommentColumn, args=(fileName, ))
-		t = multiprocessing.Process(target = sortByFirstComment, args=(fileName, ))
-		#t = multiprocessing.Process(target = addFriendsColumn, args=(fileName, ))
-		#t = multiprocessing.Process(target=addUsersWhichCommentedAfter, args=(fileName, usersDict))
-		processes.append(t)
-		t.start()
-	for one_process in processes:
-		one_process.join()
-
-		
-	#addUsersWhichCommentedAfter(fileName, usersDic)
-
+	#extractUsersReviewingImportantBusinessesBatch(most_popular_business_id)
 
+	fileNames = ["usersReviewingImportantBusinesses_" + business_id + ".csv" for business_id in most_popular_business_id]
+	#featureExecutor.runTasks(addFirstCommentColumn, fileNames)
+	featureExecutor.runTasks(sortByFirstComment, fileNames)
+	#featureExecutor.runTasks(addFriendsColumn, fileNames)
+	#featureExecutor.runTasks(addUsersWhichCommentedAfter, fileNames, sharedArgs=(friendGraph.getFriendGraph(), ))
+	#computeInfluenceForBusinesses()
+	#pipelineRunner.runPipeline(buildFeaturePipeline(most_popular_business_id))
@@ -0,0 +1,72 @@
+import multiprocessing
+import sys
+import traceback
+
+#set in the parent right before the pool forks, so workers inherit them instead of receiving pickled copies per task
+_function = None
+_tasks = None
+_sharedArgs = ()
+
+
+def forkContext():
+	#workers read _function, _tasks and _sharedArgs from memory inherited at fork; a spawned worker would see them unset
+	try:
+		if hasattr(multiprocessing, 'get_context'):
+			return multiprocessing.get_context('fork')
+		if sys.platform != 'win32':
+			return multiprocessing
+	except ValueError:
+		pass
+	raise RuntimeError("featureExecutor needs the fork start method, which %s does not support" % sys.platform)
+
+def defaultWorkers(numberOfTasks):
+	return max(1, min(multiprocessing.cpu_count(), numberOfTasks))
+
+def printProgress(functionName, done, total, failed):
+	print "%s: %d/%d tasks done, %d failed" % (functionName, done, total, failed)
+	sys.stdout.flush()
+
+def runTask(taskIndex):
+	try:
+		return taskIndex, True, _function(_tasks[taskIndex], *_sharedArgs)
+	except Exception:
+		return taskIndex, False, traceback.format_exc()
+
+def runTasks(function, tasks, sharedArgs=(), workers=None, retries=1, progress=printProgress):
+	#function(task, *sharedArgs) runs once per task in a bounded pool; failed tasks are retried up to `retries` more times
+	global _function, _tasks, _sharedArgs
+	tasks = list(tasks)
+	results = [None for x in range(len(tasks))]
+	errors = {}
+	pending = list(range(len(tasks)))
+	if workers is None:
+		workers = defaultWorkers(len(tasks))
+	context = forkContext()
+	_function, _tasks, _sharedArgs = function, tasks, tuple(sharedArgs)
+	try:
+		for attempt in range(retries + 1):
+			if not pending:
+				break
+			errors.clear()
+			pool = context.Pool(processes=min(workers, len(pending)))
+			try:
+				done = len(tasks) - len(pending)
+				for taskIndex, succeeded, value in pool.imap_unordered(runTask, pending):
+					if succeeded:
+						done += 1
+						results[taskIndex] = value
+					else:
+						errors[taskIndex] = value
+					if progress is not None:
+						progress(function.__name__, done, len(tasks), len(errors))
+				pool.close()
+			finally:
+				pool.terminate()
+				pool.join()
+			pending = sorted(errors)
+	finally:
+		_function, _tasks, _sharedArgs = None, None, ()
+	if errors:
+		failedTasks = ", ".join(repr(tasks[taskIndex]) for taskIndex in sorted(errors))
+		raise RuntimeError("%s failed for %s after %d attempts:\n%s" % (function.__name__, failedTasks, retries + 1, errors[sorted(errors)[0]]))
+	return results
@@ -1,20 +1,28 @@
 from scipy import stats
 import csv
 import pandas as pd
+import numpy as np
 import operator
 import ast
+import csvStream
+import columnarCache
+import categoryIndex
+import instrumentation
 
 
+@instrumentation.instrumented
 def filter_city(csvFile):
-	csvFile = pd.read_csv(csvFile)
+	csvFile = columnarCache.readColumnar(csvFile, ['business_id', 'review_count', 'latitude', 'longitude', 'name', 'city'])
 	#print csvRead.city.unique
 	cities = ["Las Vegas"] #, "Madison", "Phoenix", Montreal", "Toronto", "Nottingham", "Sidney"]
 	df = csvFile[csvFile['city'].isin(cities)]
 	pearsonDf = df[['business_id', 'review_count', 'latitude', 'longitude', 'name']]
 	pearsonDf.to_csv("filteredCity.csv", index=False)
+	instrumentation.addOutputFile("filteredCity.csv")
 
+@instrumentation.instrumented
 def getReviewingUsers(csvFile):
-	csvFile = pd.read_csv(csvFile)
+	csvFile = columnarCache.readColumnar(csvFile, ['business_id'])
 	allBusiness_IDs = {}
 	for i in range (len(csvFile.business_id)):
 		currentID = csvFile.business_id[i]
@@ -27,64 +35,73 @@ def getReviewingUsers(csvFile):
 	print sorted_businesses
 	#df.to_csv("reviewingUsers.csv")
 
+@instrumentation.instrumented
 def filter_category(csvFile):
-	csvFile = pd.read_csv(csvFile)
-	categories = ["Restaurant", "Food", "Restaurants", "Coffee", "Tea", "Bar", 
-	"Bars", "Nightclub", "Club", "Nightlife", "Festivals", "Clubs"]
-	df = csvFile[csvFile['categories'].str.contains('|'.join(categories))]
+	csvFile = columnarCache.readColumnar(csvFile)
+	#exact category tokens: a substring match let "Bar" pick up "Barbers"
+	categories = ["Restaurants", "Food", "Coffee & Tea", "Tea Rooms", "Bars",
+	"Nightlife", "Dance Clubs", "Festivals"]
+	df = csvFile[categoryIndex.buildCategoryIndex(csvFile).businessesInAny(categories)]
 	df.to_csv("filteredCategories.csv")
+	instrumentation.addOutputFile("filteredCategories.csv")
+@instrumentation.instrumented
 def filter_reviews(reviewFile, businessFile):
-	reviewFile = pd.read_csv(reviewFile)
-	columnsList = list(reviewFile)
-	businessFile = pd.read_csv(businessFile)
-	reviewFile = pd.merge(reviewFile, businessFile, on="business_id", suffixes=['', '_'])
-	reviewFile = reviewFile[columnsList]
+	businessFile = pd.read_csv(businessFile, usecols=['business_id'])
+	reviewFile = csvStream.filterCsv(reviewFile, predicate=csvStream.isInColumn('business_id', businessFile.business_id), parseDates=False)
 	reviewFile.to_csv("filteredReview.csv")
+	instrumentation.addOutputFile("filteredReview.csv")
 
+@instrumentation.instrumented
 def filter_users(userFile, reviewFile):
-	userFile = pd.read_csv(userFile)
-	reviewFile = pd.read_csv(reviewFile)
+	userFile = columnarCache.readColumnar(userFile)
+	reviewFile = columnarCache.readColumnar(reviewFile, ['user_id'])
 
 	userList = userFile.user_id
 	reviewUserList = reviewFile.user_id
 	userFile = userFile.loc[userFile['user_id'].isin(reviewUserList)]
 	userFile.to_csv("filteredUser.csv")	
+	instrumentation.addOutputFile("filteredUser.csv")
+
+def aggregateByBusiness(childFile, aggregations):
+	#aggregations maps an output column to (source column, how), how being "count" or any groupby reduction such as "sum", "last" or "max"
+	grouped = childFile.groupby('business_id', sort=False)
+	aggregatedColumns = []
+	for outputColumn, (sourceColumn, how) in aggregations.items():
+		if how == "count":
+			aggregatedColumn = grouped.size()
+		else:
+			aggregatedColumn = grouped[sourceColumn].agg(how)
+		aggregatedColumns.append(aggregatedColumn.rename(outputColumn))
+	return pd.concat(aggregatedColumns, axis=1)
 
+def enrichBusinessTable(businessFile, childFile, aggregations):
+	childFile = childFile.loc[childFile['business_id'].isin(businessFile.business_id)]
+	aggregated = aggregateByBusiness(childFile, aggregations)
+	enriched = businessFile.drop(columns=[column for column in aggregated.columns if column in businessFile.columns])
+	enriched = enriched.join(aggregated, on='business_id')
+	#businesses without child rows get 0 for counts and numeric reductions, like the former per-business loops
+	for outputColumn, (sourceColumn, how) in aggregations.items():
+		if how == "count":
+			enriched[outputColumn] = enriched[outputColumn].fillna(0).astype(np.int64)
+		elif pd.api.types.is_numeric_dtype(childFile[sourceColumn]):
+			enriched[outputColumn] = enriched[outputColumn].fillna(0).astype(childFile[sourceColumn].dtype)
+	return enriched
+
+@instrumentation.instrumented
 def addTipCount(businessFile, tipFile):
-	tipFile = pd.read_csv(tipFile)
+	tipFile = columnarCache.readColumnar(tipFile, ['business_id'])
 	businessFile = pd.read_csv(businessFile)
 	print "businessFile length:", len(businessFile.business_id)
-	businessFileIds = businessFile.business_id
-	print len(tipFile.business_id)
-	tipCount = [0 for x in range(len(businessFile.business_id))]
-	tipFile = tipFile.loc[tipFile['business_id'].isin(businessFileIds)]
-	tipFile = tipFile.reset_index(drop = True)
-	print len(tipFile.business_id)
-	for i in range (len(businessFile.business_id)):
-		currentBusinessID = businessFile.business_id[i]
-		for j in range(len(tipFile.business_id)):
-			currentBusinessTipID = tipFile.business_id[j]
-			if (currentBusinessID == currentBusinessTipID):
-				tipCount[i] += 1
-	businessFile['tipCount'] = tipCount
+	businessFile = enrichBusinessTable(businessFile, tipFile, {'tipCount': ('business_id', "count")})
 	businessFile.to_csv("businessWithTipCount.csv")
+	instrumentation.addOutputFile("businessWithTipCount.csv")
+@instrumentation.instrumented
 def addCheckinCount(businessFile, checkinFile):
 	businessFile = pd.read_csv(businessFile)
-	checkinFile = pd.read_csv(checkinFile)
-	businessFileIds = businessFile.business_id
-	checkinCount = [0 for x in range(len(businessFile.business_id))]
-	# checkinFile = checkinFile.loc[checkinFile['business_id'].isin(businessFileIds)]
-	# checkinFile = checkinFile.reset_index(drop = True)
-	# checkinFile.to_csv("MadisonCheckin.csv")
-
-	for i in range (len(businessFile.business_id)):
-		currentBusinessID = businessFile.business_id[i]
-		for j in range(len(checkinFile.business_id)):
-			currentBusinesscheckinID = checkinFile.business_id[j]
-			if (currentBusinessID == currentBusinesscheckinID):
-				checkinCount[i] = checkinFile.checkinSum[j]
-	businessFile['checkinCount'] = checkinCount
+	checkinFile = pd.read_csv(checkinFile, usecols=['business_id', 'checkinSum'])
+	businessFile = enrichBusinessTable(businessFile, checkinFile, {'checkinCount': ('checkinSum', "last")})
 	businessFile.to_csv("businessWithCheckinCount.csv")
+	instrumentation.addOutputFile("businessWithCheckinCount.csv")
 
 def computePearsonCorrelation(businessFile):
 	businessFile = pd.read_csv(businessFile)
@@ -92,15 +109,11 @@ def computePearsonCorrelation(businessFile):
 	print "tip, checkinCount correlation: ", stats.pearsonr(businessFile.tipCount, businessFile.checkinCount)
 	print "review+ tip, checkinCount correlation: ", stats.pearsonr(businessFile.reviewPlusTips, businessFile.checkinCount)
 
+@instrumentation.instrumented
 def findUniqueCategories(csvFile):
-	csvFile = pd.read_csv(csvFile)
-	uniqueCategories = []
-	for i in range(len(csvFile.categories)):
-		currentList = ast.literal_eval(csvFile.categories[i])
-		for j in range(len(currentList)):
-			if currentList[j] not in uniqueCategories:
-				uniqueCategories.append(currentList[j])
+	uniqueCategories = categoryIndex.buildCategoryIndex(csvFile).categoryCounts()
 	print uniqueCategories
+	return uniqueCategories
 if __name__ == '__main__':
 	filter_city("business.csv")
 	#filter_category("business.csv")
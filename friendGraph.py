@@ -0,0 +1,103 @@
+import os
+import numpy as np
+import pandas as pd
+import columnarCache
+
+FRIEND_GRAPH_DIRECTORY = "friendGraph"
+
+
+def parseFriendStrings(friendStrings):
+	#handles both "['id1', 'id2']" and "id1, id2" as written by the different Yelp dumps; "None" means no friends
+	cleaned = friendStrings.fillna("").astype(str).str.replace(r"[\[\]'\" ]", "")
+	cleaned = cleaned.where(cleaned != "None", "")
+	friendLists = cleaned.str.split(",")
+	return [[friend for friend in friends if friend] for friends in friendLists]
+
+
+class FriendGraph(object):
+	#users are interned to int32 ids; the friends of user i are neighbors[offsets[i]:offsets[i + 1]]
+
+	def __init__(self, userIds, offsets, neighbors):
+		self.userIds = userIds
+		self.offsets = offsets
+		self.neighbors = neighbors
+		self.userIndex = dict((userId, i) for i, userId in enumerate(userIds.tolist()))
+
+	def __len__(self):
+		return len(self.userIds)
+
+	def __contains__(self, userId):
+		return userId in self.userIndex
+
+	def indexOf(self, userId):
+		return self.userIndex[userId]
+
+	def indicesOf(self, userIds):
+		return np.array([self.userIndex[userId] for userId in userIds], dtype=np.int32)
+
+	def friendIndicesOf(self, userId):
+		i = self.userIndex[userId]
+		return self.neighbors[self.offsets[i]:self.offsets[i + 1]]
+
+	def friendsOf(self, userId):
+		return self.userIds[self.friendIndicesOf(userId)].tolist()
+
+	def degree(self, userIds=None):
+		degrees = np.diff(self.offsets)
+		if userIds is None:
+			return degrees
+		return degrees[self.indicesOf(userIds)]
+
+	def save(self, directory=FRIEND_GRAPH_DIRECTORY):
+		#neighbors.npy goes last, as getFriendGraph takes it as the sign of a complete graph
+		columnarCache.makeDirectory(directory)
+		for name, values in [("userIds", self.userIds), ("offsets", self.offsets), ("neighbors", self.neighbors)]:
+			path = os.path.join(directory, name + ".npy")
+			temporaryPath = columnarCache.temporaryFile(path)
+			with open(temporaryPath, "wb") as f:
+				np.save(f, values)
+			os.rename(temporaryPath, path)
+
+
+def buildFriendGraph(userFile="user.csv", chunkSize=columnarCache.CONVERSION_CHUNK_SIZE):
+	#friends that have no row of their own in user.csv are still interned, with an empty adjacency
+	userIndex = {}
+	userIds = []
+	friendIndicesByUser = {}
+	for chunk in columnarCache.readColumnarChunks(userFile, ['user_id', 'friends'], chunkSize):
+		for userId, friends in zip(chunk.user_id.astype(str).tolist(), parseFriendStrings(chunk.friends)):
+			if userId not in userIndex:
+				userIndex[userId] = len(userIds)
+				userIds.append(userId)
+			friendIndices = []
+			for friend in friends:
+				if friend not in userIndex:
+					userIndex[friend] = len(userIds)
+					userIds.append(friend)
+				friendIndices.append(userIndex[friend])
+			friendIndicesByUser[userIndex[userId]] = np.array(friendIndices, dtype=np.int32)
+	degreeByUser = np.zeros(len(userIds), dtype=np.int64)
+	for user, friendIndices in friendIndicesByUser.items():
+		degreeByUser[user] = len(friendIndices)
+	offsets = np.zeros(len(userIds) + 1, dtype=np.int64)
+	np.cumsum(degreeByUser, out=offsets[1:])
+	neighbors = np.zeros(offsets[-1], dtype=np.int32)
+	for user, friendIndices in friendIndicesByUser.items():
+		neighbors[offsets[user]:offsets[user + 1]] = friendIndices
+	return FriendGraph(np.array(userIds, dtype=str), offsets, neighbors)
+
+def friendGraphFiles(directory=FRIEND_GRAPH_DIRECTORY):
+	return [os.path.join(directory, name + ".npy") for name in ["userIds", "offsets", "neighbors"]]
+
+def loadFriendGraph(directory=FRIEND_GRAPH_DIRECTORY, mmapMode="r"):
+	userIds = np.load(os.path.join(directory, "userIds.npy"), mmap_mode=mmapMode)
+	offsets = np.load(os.path.join(directory, "offsets.npy"), mmap_mode=mmapMode)
+	neighbors = np.load(os.path.join(directory, "neighbors.npy"), mmap_mode=mmapMode)
+	return FriendGraph(userIds, offsets, neighbors)
+
+def getFriendGraph(userFile="user.csv", directory=FRIEND_GRAPH_DIRECTORY):
+	if os.path.exists(os.path.join(directory, "neighbors.npy")):
+		return loadFriendGraph(directory)
+	friendGraph = buildFriendGraph(userFile)
+	friendGraph.save(directory)
+	return friendGraph
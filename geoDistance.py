@@ -0,0 +1,80 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+EARTH_RADIUS_KM = 6373.0
+
+
+def haversineDistances(lat1, lon1, lat2, lon2):		#scale is km, inputs in degrees and broadcast against each other
+	lat1 = np.radians(lat1)
+	lat2 = np.radians(lat2)
+	dlon = np.radians(lon2) - np.radians(lon1)
+	dlat = lat2 - lat1
+	a = np.sin(dlat / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2)**2
+	a = np.clip(a, 0., 1.)
+	c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+	return EARTH_RADIUS_KM * c
+
+def averageDistances(latitudes, longitudes, blockSize=1024):
+	#tiles of blockSize x n distances keep memory bounded for any number of businesses
+	latitudes = np.asarray(latitudes, dtype=np.float64)
+	longitudes = np.asarray(longitudes, dtype=np.float64)
+	totals = np.zeros(len(latitudes))
+	for start in range(0, len(latitudes), blockSize):
+		stop = min(start + blockSize, len(latitudes))
+		for columnStart in range(0, len(latitudes), blockSize):
+			columnStop = min(columnStart + blockSize, len(latitudes))
+			tile = haversineDistances(latitudes[start:stop, None], longitudes[start:stop, None],
+				latitudes[None, columnStart:columnStop], longitudes[None, columnStart:columnStop])
+			totals[start:stop] += tile.sum(axis=1)
+	if len(latitudes) > 0:
+		totals /= len(latitudes)
+	return totals
+
+def toUnitVectors(latitudes, longitudes):
+	latitudes = np.radians(np.asarray(latitudes, dtype=np.float64))
+	longitudes = np.radians(np.asarray(longitudes, dtype=np.float64))
+	return np.column_stack([np.cos(latitudes) * np.cos(longitudes), np.cos(latitudes) * np.sin(longitudes), np.sin(latitudes)])
+
+def kmToChord(distanceKm):
+	return 2 * np.sin(np.minimum(np.asarray(distanceKm, dtype=np.float64) / EARTH_RADIUS_KM, np.pi) / 2)
+
+def chordToKm(chord):
+	return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(np.asarray(chord, dtype=np.float64) / 2, 0., 1.))
+
+
+class SpatialIndex(object):
+	#points live on the unit sphere, where straight-line (chord) distance orders exactly like great-circle distance,
+	#so a KD-tree over them answers haversine radius and nearest-neighbour queries
+
+	def __init__(self, latitudes, longitudes, ids=None):
+		self.latitudes = np.asarray(latitudes, dtype=np.float64)
+		self.longitudes = np.asarray(longitudes, dtype=np.float64)
+		self.ids = None if ids is None else np.asarray(ids, dtype=object)
+		self.tree = cKDTree(toUnitVectors(self.latitudes, self.longitudes))
+
+	def __len__(self):
+		return len(self.latitudes)
+
+	def queryRadius(self, latitude, longitude, radiusKm):
+		indices = np.array(sorted(self.tree.query_ball_point(toUnitVectors([latitude], [longitude])[0], kmToChord(radiusKm))), dtype=np.int64)
+		distances = haversineDistances(latitude, longitude, self.latitudes[indices], self.longitudes[indices])
+		order = np.argsort(distances, kind='mergesort')
+		return indices[order], distances[order]
+
+	def queryNearest(self, latitude, longitude, k=1):
+		k = min(k, len(self))
+		if k == 0:
+			return np.zeros(0, dtype=np.int64), np.zeros(0)
+		chords, indices = self.tree.query(toUnitVectors([latitude], [longitude])[0], k=k)
+		indices = np.atleast_1d(indices)
+		return indices, chordToKm(np.atleast_1d(chords))
+
+	def countWithinRadius(self, radiusKm):
+		#for every indexed point, the number of other points within radiusKm
+		neighbors = self.tree.query_ball_point(self.tree.data, kmToChord(radiusKm))
+		return np.array([len(pointNeighbors) - 1 for pointNeighbors in neighbors], dtype=np.int64)
+
+	def idsOf(self, indices):
+		if self.ids is None:
+			return indices
+		return self.ids[indices]
@@ -0,0 +1,154 @@
+import json
+import os
+import numpy as np
+import networkx as nx
+
+#a graph is a directory: manifest.json, nodes.npy, one raw file per edge array and attributes/<name>.npy per node attribute
+MANIFEST_FILE = "manifest.json"
+NODES_FILE = "nodes.npy"
+ATTRIBUTES_DIRECTORY = "attributes"
+EDGE_ARRAYS = [("source", np.int32), ("target", np.int32), ("weight", np.float64)]
+EDGE_CHUNK_SIZE = 1000000
+FORMAT_VERSION = 1
+
+
+def edgeFile(directory, name):
+	return os.path.join(directory, "edge_" + name + ".bin")
+
+def attributeFile(directory, name):
+	return os.path.join(directory, ATTRIBUTES_DIRECTORY, name + ".npy")
+
+def graphFiles(directory):
+	return [os.path.join(directory, MANIFEST_FILE), os.path.join(directory, NODES_FILE)] + [edgeFile(directory, name) for name, dtype in EDGE_ARRAYS]
+
+
+class GraphWriter(object):
+	#edges are appended chunk by chunk; the manifest with the final edge count is written on close
+
+	def __init__(self, directory, nodeIds):
+		self.directory = directory
+		if not os.path.isdir(os.path.join(directory, ATTRIBUTES_DIRECTORY)):
+			os.makedirs(os.path.join(directory, ATTRIBUTES_DIRECTORY))
+		#attribute columns of a previous graph would no longer line up with the new nodes
+		for name in attributeNames(directory):
+			os.remove(attributeFile(directory, name))
+		self.numberOfNodes = len(nodeIds)
+		np.save(os.path.join(directory, NODES_FILE), np.asarray([str(nodeId) for nodeId in nodeIds], dtype=str))
+		self.edgeFiles = dict((name, open(edgeFile(directory, name), "wb")) for name, dtype in EDGE_ARRAYS)
+		self.numberOfEdges = 0
+
+	def appendEdges(self, sources, targets, weights):
+		for name, dtype in EDGE_ARRAYS:
+			values = {"source": sources, "target": targets, "weight": weights}[name]
+			self.edgeFiles[name].write(np.ascontiguousarray(values, dtype=dtype).tobytes())
+		self.numberOfEdges += len(weights)
+
+	def close(self):
+		for f in self.edgeFiles.values():
+			f.close()
+		manifest = {
+			"version": FORMAT_VERSION,
+			"nodes": self.numberOfNodes,
+			"edges": self.numberOfEdges,
+			"edgeArrays": dict((name, np.dtype(dtype).str) for name, dtype in EDGE_ARRAYS)
+		}
+		with open(os.path.join(self.directory, MANIFEST_FILE), "w") as f:
+			json.dump(manifest, f)
+
+
+def saveGraphArrays(directory, nodeIds, sources, targets, weights):
+	writer = GraphWriter(directory, nodeIds)
+	for start in range(0, len(weights), EDGE_CHUNK_SIZE):
+		stop = start + EDGE_CHUNK_SIZE
+		writer.appendEdges(sources[start:stop], targets[start:stop], weights[start:stop])
+	writer.close()
+
+def saveGraph(directory, G):
+	nodeIds = list(G.nodes())
+	positions = dict((node, i) for i, node in enumerate(nodeIds))
+	edges = list(G.edges(data='weight', default=1.))
+	sources = np.array([positions[u] for u, v, w in edges], dtype=np.int32)
+	targets = np.array([positions[v] for u, v, w in edges], dtype=np.int32)
+	weights = np.array([w for u, v, w in edges], dtype=np.float64)
+	saveGraphArrays(directory, nodeIds, sources, targets, weights)
+	names = set()
+	for node, attributes in G.nodes(data=True):
+		names.update(attributes)
+	for name in names:
+		appendNodeAttribute(directory, name, dict((node, attributes[name]) for node, attributes in G.nodes(data=True) if name in attributes))
+
+def loadNodeIds(directory, mmapMode="r"):
+	return np.load(os.path.join(directory, NODES_FILE), mmap_mode=mmapMode)
+
+def unicodeText(value):
+	#python 2 reads the csv files as utf-8 byte strings, which numpy and unicode() would decode as ascii
+	return value.decode("utf-8") if isinstance(value, str) else unicode(value)
+
+def appendNodeAttribute(directory, name, values):
+	#writes one column without touching the edges; values are aligned to the stored nodes or keyed by node id
+	nodeIds = loadNodeIds(directory).tolist()
+	if isinstance(values, dict) or hasattr(values, 'index') and hasattr(values, 'reindex'):
+		values = dict(values.items()) if not isinstance(values, dict) else values
+		present = [values[nodeId] for nodeId in nodeIds if nodeId in values]
+		isText = any(isinstance(value, basestring) for value in present)
+		missing = u"" if isText else np.nan
+		values = [values.get(nodeId, missing) for nodeId in nodeIds]
+	if not isinstance(values, np.ndarray):
+		values = [unicodeText(value) if isinstance(value, str) else value for value in values]
+	values = np.asarray(values)
+	if len(values) != len(nodeIds):
+		raise ValueError("attribute %s has %d values for %d nodes" % (name, len(values), len(nodeIds)))
+	if values.dtype.kind == 'O':
+		values = np.array([u"" if value is None or (isinstance(value, float) and np.isnan(value)) else unicodeText(value) for value in values])
+	elif values.dtype.kind in 'biuf':
+		values = values.astype(np.float64)
+	np.save(attributeFile(directory, name), values)
+
+def attributeNames(directory):
+	attributesDirectory = os.path.join(directory, ATTRIBUTES_DIRECTORY)
+	if not os.path.isdir(attributesDirectory):
+		return []
+	return sorted(fileName[:-len(".npy")] for fileName in os.listdir(attributesDirectory) if fileName.endswith(".npy"))
+
+def loadNodeAttribute(directory, name, mmapMode="r"):
+	return np.load(attributeFile(directory, name), mmap_mode=mmapMode)
+
+def loadGraphArrays(directory, attributes=None):
+	#memory-mapped arrays, for callers that do not need a networkx object
+	with open(os.path.join(directory, MANIFEST_FILE)) as f:
+		manifest = json.load(f)
+	if manifest["version"] > FORMAT_VERSION:
+		raise ValueError("%s has graph format version %d, this reader supports up to %d" % (directory, manifest["version"], FORMAT_VERSION))
+	arrays = {"nodes": loadNodeIds(directory)}
+	for name, dtype in manifest["edgeArrays"].items():
+		if manifest["edges"] == 0:
+			arrays[name] = np.zeros(0, dtype=dtype)
+		else:
+			arrays[name] = np.memmap(edgeFile(directory, name), dtype=dtype, mode="r", shape=(manifest["edges"],))
+	if attributes is None:
+		attributes = attributeNames(directory)
+	arrays["attributes"] = dict((name, loadNodeAttribute(directory, name)) for name in attributes)
+	return arrays
+
+def nativeText(value):
+	#arrays saved under python 2 hold byte strings, which python 3 (the analysis notebook) loads as bytes
+	return value.decode("utf-8") if isinstance(value, bytes) and not isinstance(value, str) else value
+
+def loadGraph(directory, attributes=None):
+	arrays = loadGraphArrays(directory, attributes)
+	nodeIds = [nativeText(nodeId) for nodeId in arrays["nodes"].tolist()]
+	nodeArray = np.asarray(nodeIds, dtype=object)
+	G = nx.Graph()
+	G.add_nodes_from(nodeIds)
+	G.add_weighted_edges_from(zip(nodeArray[arrays["source"]], nodeArray[arrays["target"]], arrays["weight"].tolist()))
+	for name, values in arrays["attributes"].items():
+		#missing values (NaN or empty text) leave the attribute unset, as in the JSON graphs
+		values = [nativeText(value) for value in values.tolist()]
+		nx.set_node_attributes(G, dict((nodeId, value) for nodeId, value in zip(nodeIds, values) if value == value and value != u""), name)
+	return G
+
+def convertJsonGraph(jsonFile, directory):
+	with open(jsonFile) as f:
+		G = nx.readwrite.json_graph.node_link_graph(json.load(f), multigraph=False)
+	saveGraph(directory, G)
+	return G
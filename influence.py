@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+import csvStream
+
+
+def rankIndex(userIndices, numberOfUsers):
+	#rank[u] is the row of user u in the business file, -1 for users that did not comment
+	rank = np.full(numberOfUsers, -1, dtype=np.int64)
+	rank[userIndices] = np.arange(len(userIndices))
+	return rank
+
+def computeFriendsWhoCommentedAfter(userIds, firstComments, friends):
+	#rows must already be ordered by firstComment (sortByFirstComment); a friend counts when it sits at the same row or later
+	userIds = [str(user_id) for user_id in userIds]
+	firstComments = [str(firstComment) for firstComment in firstComments]
+	userIndices = np.array([friends.userIndex.get(user_id, -1) for user_id in userIds], dtype=np.int64)
+	known = userIndices >= 0
+	rank = rankIndex(userIndices[known], len(friends))
+	rowOfRank = np.flatnonzero(known)
+	friendsWhichCommentedAfter = [[] for x in range(len(userIds))]
+	for i in np.flatnonzero(known):
+		friendRanks = rank[friends.friendIndicesOf(userIds[i])]
+		#a friend listed twice in user.csv is still one row
+		friendRows = np.unique(rowOfRank[friendRanks[friendRanks >= 0]])
+		friendsWhichCommentedAfter[i] = [{userIds[j]: firstComments[j]} for j in friendRows[friendRows >= i]]
+	return friendsWhichCommentedAfter
+
+def friendAdjacency(friends):
+	#user x user CSR matrix straight from the friend graph's offsets and neighbors
+	numberOfUsers = len(friends)
+	return sparse.csr_matrix((np.ones(len(friends.neighbors), dtype=np.int8), np.asarray(friends.neighbors), np.asarray(friends.offsets)),
+		shape=(numberOfUsers, numberOfUsers))
+
+def firstCommentTimes(reviewFile="review.csv", tipFile="tip.csv", businessIds=None, chunkSize=csvStream.DEFAULT_CHUNK_SIZE):
+	#earliest review or tip date of every (user, business) pair, in one scan of each file
+	predicate = csvStream.isInColumn('business_id', businessIds) if businessIds is not None else None
+	earliest = []
+	for fileName in [reviewFile, tipFile]:
+		for chunk in csvStream.readChunks(fileName, ['user_id', 'business_id', 'date'], predicate, chunkSize,
+				dtypes={'user_id': object, 'business_id': object}):
+			earliest.append(chunk.groupby(['user_id', 'business_id'], sort=False).date.min())
+	if not earliest:
+		return pd.DataFrame(columns=['user_id', 'business_id', 'firstComment'])
+	earliest = pd.concat(earliest)
+	earliest = earliest.groupby(level=[0, 1], sort=False).min()
+	return earliest.rename('firstComment').reset_index()
+
+def firstCommentMatrix(firstComments, friends):
+	#user x business matrix of first-comment days counted from firstDay (1 = firstDay); users missing from the friend graph are left out
+	days = pd.to_datetime(firstComments.firstComment).values.astype('datetime64[D]')
+	firstDay = days.min() if len(days) else np.datetime64('1970-01-01')
+	userIndices = np.array([friends.userIndex.get(str(user_id), -1) for user_id in firstComments.user_id], dtype=np.int64)
+	businessCodes, businessIds = pd.factorize(firstComments.business_id.astype(str))
+	entries = pd.DataFrame({'user': userIndices, 'business': businessCodes, 'day': (days - firstDay).astype(np.int64) + 1})
+	#a pair listed more than once keeps its earliest day
+	entries = entries[entries.user >= 0].groupby(['user', 'business'], sort=False).day.min().reset_index()
+	times = sparse.csr_matrix((entries.day.values, (entries.user.values, entries.business.values)), shape=(len(friends), len(businessIds)))
+	times.sort_indices()
+	return times, np.asarray(businessIds, dtype=object), firstDay
+
+def influencedFriendCounts(adjacency, times, includeTies=True, maxTriples=20000000):
+	#masked product: for every nonzero (u, b) of times, the friends f of u with times[f, b] > 0, and those among them
+	#with times[f, b] >= times[u, b]; aligned with times.data. Rows are processed in chunks of at most maxTriples candidate triples
+	numberOfBusinesses = times.shape[1]
+	commentsPerUser = np.diff(times.indptr)
+	commenters = commentsPerUser > 0
+	adjacency = sparse.csr_matrix(adjacency)
+	#only friendships between two commenting users can contribute; repeated friends count once and nobody is their own friend
+	adjacency = sparse.diags(commenters.astype(np.int8)).dot(adjacency).dot(sparse.diags(commenters.astype(np.int8))).tocoo()
+	keep = (adjacency.row != adjacency.col) & (adjacency.data != 0)
+	adjacency = sparse.csr_matrix((np.ones(keep.sum(), dtype=np.int8), (adjacency.row[keep], adjacency.col[keep])), shape=adjacency.shape)
+	triplesPerUser = adjacency.dot(commentsPerUser.astype(np.int64))
+	entryKeys = np.repeat(np.arange(times.shape[0], dtype=np.int64), commentsPerUser) * numberOfBusinesses + times.indices
+	commentingFriends = np.zeros(len(times.data), dtype=np.int64)
+	influencedFriends = np.zeros(len(times.data), dtype=np.int64)
+	users = np.flatnonzero(triplesPerUser > 0)
+	cumulativeTriples = np.cumsum(triplesPerUser[users])
+	start = 0
+	while start < len(users):
+		done = cumulativeTriples[start - 1] if start > 0 else 0
+		stop = max(start + 1, np.searchsorted(cumulativeTriples, done + maxTriples, side='right'))
+		chunk = adjacency[users[start:stop]].tocoo()
+		friendUsers, friendsOfThem = users[start:stop][chunk.row], chunk.col
+		#every business each friend commented on, paired with the user whose friend it is
+		lengths = commentsPerUser[friendsOfThem]
+		positions = np.repeat(times.indptr[friendsOfThem], lengths) + np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+		pairUsers = np.repeat(friendUsers, lengths).astype(np.int64)
+		keys = pairUsers * numberOfBusinesses + times.indices[positions]
+		#keep the triples where the user commented on the same business
+		entries = np.searchsorted(entryKeys, keys)
+		entries[entries >= len(entryKeys)] = 0
+		matched = entryKeys[entries] == keys
+		entries, friendTimes = entries[matched], times.data[positions[matched]]
+		commentingFriends += np.bincount(entries, minlength=len(times.data))
+		after = friendTimes >= times.data[entries] if includeTies else friendTimes > times.data[entries]
+		influencedFriends += np.bincount(entries[after], minlength=len(times.data))
+		start = stop
+	return commentingFriends, influencedFriends
+
+def computeInfluence(firstComments, friends, includeTies=True):
+	#one row per (user, business) first comment: friends in total, friends who commented on the business, and those who did so later
+	times, businessIds, firstDay = firstCommentMatrix(firstComments, friends)
+	commentingFriends, influencedFriends = influencedFriendCounts(friendAdjacency(friends), times, includeTies)
+	rows = np.repeat(np.arange(times.shape[0]), np.diff(times.indptr))
+	totalFriends = np.diff(np.asarray(friends.offsets))[rows]
+	with np.errstate(divide='ignore', invalid='ignore'):
+		ratio = np.where(totalFriends > 0, influencedFriends / totalFriends.astype(np.float64), 0.)
+	return pd.DataFrame({
+		'user_id': np.asarray(friends.userIds)[rows],
+		'business_id': businessIds[times.indices],
+		'firstComment': (firstDay + (times.data - 1).astype('timedelta64[D]')).astype(str),
+		'totalFriends': totalFriends,
+		'commentingFriends': commentingFriends,
+		'influencedFriends': influencedFriends,
+		'influencedFriendsRatio': ratio
+	}, columns=['user_id', 'business_id', 'firstComment', 'totalFriends', 'commentingFriends', 'influencedFriends', 'influencedFriendsRatio'])
@@ -0,0 +1,308 @@
+import cProfile
+import csv
+import functools
+import json
+import os
+import pstats
+import resource
+import socket
+import threading
+import time
+import pandas as pd
+try:
+	import tracemalloc
+except ImportError:
+	tracemalloc = None
+try:
+	import pyarrow.parquet as pq
+except ImportError:
+	pq = None
+
+#off unless configure() is called or INSTRUMENTATION_LOG names the JSON-lines log, so decorated stages cost one dict lookup
+settings = {
+	'enabled': bool(os.environ.get("INSTRUMENTATION_LOG")),
+	'logFile': os.environ.get("INSTRUMENTATION_LOG") or "instrumentation.jsonl",
+	'profile': False,
+	'profileDirectory': "profiles",
+	'memorySampleInterval': None,
+	'topFunctions': 15,
+	'countFileRows': False
+}
+#open stages, innermost last; only the outermost one resets the peak RSS, so its peak covers the nested stages
+_openRecords = []
+
+
+def configure(logFile=None, enabled=True, profile=False, memorySampleInterval=None, profileDirectory="profiles", countFileRows=False):
+	#profile=True runs each stage under cProfile; memorySampleInterval (seconds) polls RSS, or uses tracemalloc where it exists;
+	#countFileRows=True counts the rows of the CSV and Parquet files a stage wrote as its rows out, which reads each CSV once more
+	if logFile is not None:
+		settings['logFile'] = logFile
+	settings.update({'enabled': enabled, 'profile': profile, 'memorySampleInterval': memorySampleInterval, 'profileDirectory': profileDirectory,
+		'countFileRows': countFileRows})
+
+def procValues(fileName):
+	#key: integer pairs from /proc/self/status or /proc/self/io; empty where /proc is missing
+	values = {}
+	try:
+		with open(fileName) as f:
+			for line in f:
+				key, separator, value = line.partition(":")
+				fields = value.split()
+				if fields and fields[0].isdigit():
+					values[key] = int(fields[0])
+	except IOError:
+		pass
+	return values
+
+def currentRssMb():
+	return procValues("/proc/self/status").get("VmRSS", 0) / 1024.
+
+def resetPeakRss():
+	#Linux resets VmHWM when 5 is written to clear_refs; otherwise the peak is the process's lifetime peak
+	try:
+		with open("/proc/self/clear_refs", "w") as f:
+			f.write("5")
+		return True
+	except IOError:
+		return False
+
+def peakRssMb():
+	status = procValues("/proc/self/status")
+	if "VmHWM" in status:
+		return status["VmHWM"] / 1024.
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+
+def ioBytes():
+	#rchar/wchar count every read and write call, including ones served from the page cache
+	io = procValues("/proc/self/io")
+	if "rchar" in io:
+		return io["rchar"], io["wchar"]
+	usage = resource.getrusage(resource.RUSAGE_SELF)
+	return usage.ru_inblock * 512, usage.ru_oublock * 512
+
+def cpuSeconds():
+	#worker processes count once they have been waited for, e.g. after a featureExecutor pool is joined
+	selfUsage = resource.getrusage(resource.RUSAGE_SELF)
+	childUsage = resource.getrusage(resource.RUSAGE_CHILDREN)
+	return selfUsage.ru_utime + selfUsage.ru_stime + childUsage.ru_utime + childUsage.ru_stime
+
+def countFileRows(fileName):
+	#Parquet row counts come from the footer; CSV rows are the records after the header, read with the csv module so a
+	#quoted newline inside a field (review text) does not start a new row
+	if not os.path.isfile(fileName):
+		return None
+	if fileName.endswith(".parquet"):
+		return pq.ParquetFile(fileName).metadata.num_rows if pq is not None else None
+	if not fileName.endswith(".csv"):
+		return None
+	with open(fileName, "rb") as f:
+		return max(sum(1 for row in csv.reader(f)) - 1, 0)
+
+def countRows(value):
+	if isinstance(value, (pd.DataFrame, pd.Series)):
+		return len(value)
+	if isinstance(value, (list, dict)):
+		return len(value)
+	if len(getattr(value, 'shape', ())) > 0:
+		return value.shape[0]
+	return None
+
+
+class MemorySampler(threading.Thread):
+	#polls RSS in the background so short allocation spikes between reset and end are still seen without /proc peaks
+
+	def __init__(self, interval):
+		threading.Thread.__init__(self)
+		self.daemon = True
+		self.interval = interval
+		self.samples = 0
+		self.peakMb = 0.
+		self.stopped = threading.Event()
+
+	def run(self):
+		while not self.stopped.is_set():
+			self.peakMb = max(self.peakMb, currentRssMb())
+			self.samples += 1
+			self.stopped.wait(self.interval)
+
+	def stop(self):
+		self.stopped.set()
+		self.join()
+
+
+class StageRecord(object):
+	#context manager timing one stage; callers may add rows, files written whose rows to count, and extra fields before it closes
+
+	def __init__(self, name, **fields):
+		self.name = name
+		self.fields = fields
+		self.rowsIn = None
+		self.rowsOut = None
+		self.outputFiles = []
+
+	def addRowsIn(self, rows):
+		self.rowsIn = (self.rowsIn or 0) + rows
+
+	def addRowsOut(self, rows):
+		self.rowsOut = (self.rowsOut or 0) + rows
+
+	def addOutputFile(self, fileName):
+		self.outputFiles.append(fileName)
+
+	def countFiles(self):
+		#run after the stage's time and I/O are taken, so rescanning its files is not charged to it; a file the stage
+		#did not write during this run (e.g. an existing output it returned unchanged) is not counted
+		for fileName in set(self.outputFiles):
+			if os.path.isfile(fileName) and os.path.getmtime(fileName) >= self.startTime:
+				rows = countFileRows(fileName)
+				if rows is not None:
+					self.addRowsOut(rows)
+
+	def __enter__(self):
+		if not settings['enabled']:
+			return self
+		self.peakIsLocal = resetPeakRss() if not _openRecords else False
+		_openRecords.append(self)
+		self.startRss = currentRssMb()
+		self.startRead, self.startWritten = ioBytes()
+		self.profiler = cProfile.Profile() if settings['profile'] else None
+		self.sampler = None
+		self.tracing = False
+		if settings['memorySampleInterval']:
+			if tracemalloc is not None and not tracemalloc.is_tracing():
+				tracemalloc.start()
+				self.tracing = True
+			else:
+				self.sampler = MemorySampler(settings['memorySampleInterval'])
+				self.sampler.start()
+		self.startCpu = cpuSeconds()
+		self.startTime = time.time()
+		if self.profiler is not None:
+			self.profiler.enable()
+		return self
+
+	def __exit__(self, errorType, error, errorTraceback):
+		if not settings['enabled']:
+			return False
+		if self.profiler is not None:
+			self.profiler.disable()
+		_openRecords.remove(self)
+		wallSeconds = time.time() - self.startTime
+		cpu = cpuSeconds() - self.startCpu
+		bytesRead, bytesWritten = ioBytes()
+		peakMb = peakRssMb()
+		if settings['countFileRows']:
+			self.countFiles()
+		record = {
+			'stage': self.name,
+			'start': self.startTime,
+			'wallSeconds': wallSeconds,
+			'cpuSeconds': cpu,
+			'peakRssMb': peakMb,
+			'peakIsStageLocal': self.peakIsLocal,
+			'rssDeltaMb': currentRssMb() - self.startRss,
+			'rowsIn': self.rowsIn,
+			'rowsOut': self.rowsOut,
+			'bytesRead': bytesRead - self.startRead,
+			'bytesWritten': bytesWritten - self.startWritten,
+			'pid': os.getpid(),
+			'host': socket.gethostname(),
+			'failed': errorType is not None
+		}
+		if self.sampler is not None:
+			self.sampler.stop()
+			record['sampledPeakRssMb'] = self.sampler.peakMb
+			record['memorySamples'] = self.sampler.samples
+		if self.tracing:
+			current, peak = tracemalloc.get_traced_memory()
+			record['tracedPeakMb'] = peak / 1048576.
+			record['topAllocations'] = [str(statistic) for statistic in tracemalloc.take_snapshot().statistics('lineno')[:settings['topFunctions']]]
+			tracemalloc.stop()
+		if self.profiler is not None:
+			record['profileFile'] = saveProfile(self.name, self.profiler)
+			record['topFunctions'] = topFunctions(self.profiler, settings['topFunctions'])
+		record.update(self.fields)
+		writeRecord(record)
+		return False
+
+
+def saveProfile(name, profiler):
+	if not os.path.isdir(settings['profileDirectory']):
+		os.makedirs(settings['profileDirectory'])
+	fileName = os.path.join(settings['profileDirectory'], "%s.%d.%d.prof" % (name, os.getpid(), int(time.time() * 1000)))
+	profiler.dump_stats(fileName)
+	return fileName
+
+def topFunctions(profiler, count):
+	#(function, calls, cumulative seconds) with the most cumulative time
+	statistics = pstats.Stats(profiler).stats
+	rows = [("%s:%d(%s)" % key, callCount, cumulative) for key, (primitiveCalls, callCount, total, cumulative, callers) in statistics.items()]
+	return sorted(rows, key=lambda row: -row[2])[:count]
+
+def writeRecord(record):
+	#one line per record in append mode, so forked workers can share the log
+	with open(settings['logFile'], "a") as f:
+		f.write(json.dumps(record, sort_keys=True) + "\n")
+
+def stage(name, **fields):
+	return StageRecord(name, **fields)
+
+def addOutputFile(fileName):
+	#for stages that write a fixed file instead of returning their rows, e.g. filterCity.addTipCount; a no-op outside a stage
+	if _openRecords:
+		_openRecords[-1].addOutputFile(fileName)
+
+def instrumented(function):
+	#rows in are the lengths of DataFrame/Series arguments, rows out those of the result; a returned file name counts as a written
+	#file, whose rows are counted when countFileRows is on. Path arguments are not read again
+	@functools.wraps(function)
+	def wrapper(*args, **kwargs):
+		if not settings['enabled']:
+			return function(*args, **kwargs)
+		with StageRecord(function.__module__ + "." + function.__name__) as record:
+			for argument in list(args) + list(kwargs.values()):
+				if isinstance(argument, (pd.DataFrame, pd.Series)):
+					record.addRowsIn(len(argument))
+			result = function(*args, **kwargs)
+			if isinstance(result, basestring):
+				record.addOutputFile(result)
+			else:
+				rows = countRows(result)
+				if rows is not None:
+					record.addRowsOut(rows)
+		return result
+	#functools.wraps does not set this on python 2; pipelineRunner hashes the wrapped function's source through it
+	wrapper.__wrapped__ = function
+	return wrapper
+
+def loadLog(logFile=None):
+	with open(logFile or settings['logFile']) as f:
+		return pd.DataFrame([json.loads(line) for line in f if line.strip()])
+
+def summarize(logFile=None):
+	#one row per stage, slowest total wall time first
+	log = loadLog(logFile)
+	if len(log) == 0:
+		return log
+	log['failed'] = log.failed.astype(int)
+	grouped = log.groupby('stage')
+	summary = pd.DataFrame({
+		'calls': grouped.size(),
+		'wallSeconds': grouped.wallSeconds.sum(),
+		'cpuSeconds': grouped.cpuSeconds.sum(),
+		'maxPeakRssMb': grouped.peakRssMb.max(),
+		'rowsIn': grouped.rowsIn.sum(),
+		'rowsOut': grouped.rowsOut.sum(),
+		'mbRead': grouped.bytesRead.sum() / 1048576.,
+		'mbWritten': grouped.bytesWritten.sum() / 1048576.,
+		'failed': grouped.failed.sum()
+	}, columns=['calls', 'wallSeconds', 'cpuSeconds', 'maxPeakRssMb', 'rowsIn', 'rowsOut', 'mbRead', 'mbWritten', 'failed'])
+	summary['shareOfWall'] = summary.wallSeconds / summary.wallSeconds.sum()
+	return summary.sort_values('wallSeconds', ascending=False)
+
+def printSummary(logFile=None):
+	print summarize(logFile).to_string(float_format=lambda value: "%.3f" % value)
+
+
+if __name__ == '__main__':
+	printSummary()
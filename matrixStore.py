@@ -0,0 +1,116 @@
+import json
+import struct
+import numpy as np
+from scipy import sparse
+
+#file layout: magic, format version, header length, JSON header, then each array section aligned to ALIGNMENT bytes
+MAGIC = b"YWMX"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+PREAMBLE = struct.Struct("<4sHI")
+LAYOUTS = ("dense", "csr", "coo")
+
+
+def alignOffset(offset):
+	return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+def matrixSections(matrix, layout):
+	if layout == "dense":
+		return [("values", np.ascontiguousarray(matrix))]
+	if layout == "csr":
+		matrix = sparse.csr_matrix(matrix)
+		matrix.sum_duplicates()
+		return [("data", matrix.data), ("indices", matrix.indices), ("indptr", matrix.indptr)]
+	matrix = sparse.coo_matrix(matrix)
+	return [("data", matrix.data), ("row", matrix.row), ("col", matrix.col)]
+
+def buildHeader(sections, layout, shape, dtype, businessIds, headerLength):
+	offset = alignOffset(PREAMBLE.size + headerLength)
+	sectionHeaders = {}
+	for name, values in sections:
+		sectionHeaders[name] = {"offset": offset, "dtype": values.dtype.str, "shape": list(values.shape)}
+		offset = alignOffset(offset + values.nbytes)
+	return {
+		"layout": layout,
+		"shape": list(shape),
+		"dtype": np.dtype(dtype).str,
+		"business_ids": businessIds,
+		"sections": sectionHeaders
+	}
+
+def saveWeightMatrix(fileName, matrix, businessIds=None, layout=None):
+	if layout is None:
+		layout = "csr" if sparse.issparse(matrix) else "dense"
+	if layout not in LAYOUTS:
+		raise ValueError("unknown layout %r, expected one of %s" % (layout, ", ".join(LAYOUTS)))
+	if layout == "dense" and sparse.issparse(matrix):
+		matrix = matrix.toarray()
+	shape = matrix.shape
+	if businessIds is not None:
+		businessIds = [str(businessId) for businessId in businessIds]
+		if len(businessIds) != shape[0]:
+			raise ValueError("got %d business_ids for a matrix with %d rows" % (len(businessIds), shape[0]))
+	sections = matrixSections(matrix, layout)
+	#section offsets depend on the header length, so size the header until it is stable
+	headerLength = 0
+	while True:
+		header = buildHeader(sections, layout, shape, matrix.dtype, businessIds, headerLength)
+		encodedHeader = json.dumps(header).encode("utf-8")
+		if len(encodedHeader) <= headerLength:
+			break
+		headerLength = len(encodedHeader)
+	encodedHeader = encodedHeader.ljust(headerLength, b" ")
+	with open(fileName, "wb") as f:
+		f.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, headerLength))
+		f.write(encodedHeader)
+		for name, values in sections:
+			f.seek(header["sections"][name]["offset"])
+			f.write(np.ascontiguousarray(values).tobytes())
+		f.truncate()
+
+def readHeader(fileName):
+	with open(fileName, "rb") as f:
+		magic, version, headerLength = PREAMBLE.unpack(f.read(PREAMBLE.size))
+		if magic != MAGIC:
+			raise ValueError("%s is not a weight matrix file" % fileName)
+		if version > FORMAT_VERSION:
+			raise ValueError("%s has format version %d, this reader supports up to %d" % (fileName, version, FORMAT_VERSION))
+		return json.loads(f.read(headerLength).decode("utf-8"))
+
+def mapSection(fileName, sectionHeader, mode):
+	shape = tuple(sectionHeader["shape"])
+	if int(np.prod(shape)) == 0:
+		return np.zeros(shape, dtype=sectionHeader["dtype"])
+	return np.memmap(fileName, dtype=sectionHeader["dtype"], mode=mode, offset=sectionHeader["offset"], shape=shape)
+
+def loadWeightMatrix(fileName, mode="r"):
+	#arrays are memory-mapped, so rows are only read from disk when they are touched
+	header = readHeader(fileName)
+	sections = dict((name, mapSection(fileName, sectionHeader, mode)) for name, sectionHeader in header["sections"].items())
+	shape = tuple(header["shape"])
+	layout = header["layout"]
+	if layout == "dense":
+		matrix = sections["values"]
+	elif layout == "csr":
+		matrix = sparse.csr_matrix((sections["data"], sections["indices"], sections["indptr"]), shape=shape, copy=False)
+	elif layout == "coo":
+		matrix = sparse.coo_matrix((sections["data"], (sections["row"], sections["col"])), shape=shape, copy=False)
+	else:
+		raise ValueError("%s has unknown layout %r" % (fileName, layout))
+	businessIds = header["business_ids"]
+	if businessIds is not None:
+		businessIds = np.array(businessIds, dtype=object)
+	return matrix, businessIds
+
+def convertTxtMatrix(txtFile, fileName, lengthOfRow=None, businessIds=None, layout="csr"):
+	#weightMatrix.txt holds one value per line, row after row
+	values = np.loadtxt(txtFile, dtype=np.float64, ndmin=1)
+	if lengthOfRow is None:
+		lengthOfRow = int(round(np.sqrt(len(values))))
+	if lengthOfRow * lengthOfRow != len(values):
+		raise ValueError("%s holds %d values, not a %dx%d matrix" % (txtFile, len(values), lengthOfRow, lengthOfRow))
+	matrix = values.reshape((lengthOfRow, lengthOfRow))
+	if layout != "dense":
+		matrix = sparse.csr_matrix(matrix)
+	saveWeightMatrix(fileName, matrix, businessIds, layout)
+	return matrix
@@ -0,0 +1,223 @@
+import time
+import numpy as np
+import pandas as pd
+from scipy import sparse
+import coReviewMatrix
+
+#hashes are (a * user + b) mod a Mersenne prime; user column indices stay below it, so products fit in int64
+HASH_PRIME = (1 << 31) - 1
+DEFAULT_HASHES = 128
+
+
+def jaccardBound(weight, smallerSize, largerSize):
+	#the lowest Jaccard similarity two user sets of these sizes can have at this symmetric mean overlap:
+	#weight w needs |I&J| = 2 * w * |I| * |J| / (|I| + |J|), and the Jaccard similarity falls with the size ratio
+	smallerSize = np.asarray(smallerSize, dtype=np.float64)
+	largerSize = np.asarray(largerSize, dtype=np.float64)
+	overlap = 2. * weight * smallerSize * largerSize / (smallerSize + largerSize)
+	return np.minimum(overlap / (smallerSize + largerSize - overlap), 1.)
+
+def chooseBands(numberOfHashes, jaccard, maxFalseNegativeRate=0.05):
+	#the (bands, rows) split with the most rows (fewest candidates) that still misses at most maxFalseNegativeRate of
+	#the pairs at this Jaccard similarity; when no split gets there, the one that misses fewest
+	best = None
+	for rows in range(1, numberOfHashes + 1):
+		bands = numberOfHashes // rows
+		falseNegativeRate = 1. - candidateProbability(jaccard, bands, rows)
+		if falseNegativeRate <= maxFalseNegativeRate or best is None or falseNegativeRate < best[0]:
+			best = (falseNegativeRate, bands, rows)
+	return best[1], best[2]
+
+def candidateProbability(jaccard, bands, rows):
+	return 1. - (1. - np.asarray(jaccard, dtype=np.float64) ** rows) ** bands
+
+def minHashSignatures(incidence, numberOfHashes=DEFAULT_HASHES, seed=0):
+	#one row of numberOfHashes minimum user hashes per business; businesses without users keep HASH_PRIME everywhere
+	incidence = sparse.csr_matrix(incidence)
+	if incidence.shape[1] >= HASH_PRIME:
+		raise ValueError("too many users (%d) for %d-bit MinHash" % (incidence.shape[1], 31))
+	randomState = np.random.RandomState(seed)
+	multipliers = randomState.randint(1, HASH_PRIME, size=numberOfHashes).astype(np.int64)
+	offsets = randomState.randint(0, HASH_PRIME, size=numberOfHashes).astype(np.int64)
+	signatures = np.full((incidence.shape[0], numberOfHashes), HASH_PRIME, dtype=np.int64)
+	nonEmpty = np.diff(incidence.indptr) > 0
+	starts = incidence.indptr[:-1][nonEmpty]
+	users = incidence.indices.astype(np.int64)
+	for k in range(numberOfHashes):
+		hashes = (multipliers[k] * users + offsets[k]) % HASH_PRIME
+		signatures[nonEmpty, k] = np.minimum.reduceat(hashes, starts)
+	return signatures
+
+def bucketPairs(keys):
+	#all pairs of rows sharing a key, as (smaller, larger) row indices; each row is paired with the rows after it in its bucket
+	uniqueKeys, inverse = np.unique(keys, return_inverse=True)
+	order = np.argsort(inverse, kind='mergesort')
+	groupSizes = np.bincount(inverse)
+	groupStarts = np.cumsum(groupSizes) - groupSizes
+	positions = np.arange(len(order))
+	groups = inverse[order]
+	partners = groupSizes[groups] - (positions - groupStarts[groups]) - 1
+	first = np.repeat(positions, partners)
+	second = first + 1 + np.arange(len(first)) - np.repeat(np.cumsum(partners) - partners, partners)
+	return np.minimum(order[first], order[second]), np.maximum(order[first], order[second])
+
+def candidatePairs(signatures, bands, rows, classes=None, classPairs=None):
+	#LSH banding: two businesses are candidates when all `rows` hashes of at least one band agree;
+	#with classes and classPairs, only businesses of those pairs of size classes are banded and paired
+	numberOfBusinesses = signatures.shape[0]
+	banded = signatures[:, 0] < HASH_PRIME
+	if classPairs is not None:
+		allowed = np.zeros((classes.max() + 1, classes.max() + 1), dtype=bool)
+		for smallerClass, largerClass in classPairs:
+			allowed[smallerClass, largerClass] = allowed[largerClass, smallerClass] = True
+		banded[banded] = allowed[classes[banded]].any(axis=1)
+	nonEmpty = np.flatnonzero(banded)
+	pairCodes = []
+	for band in range(bands):
+		bandSignatures = np.ascontiguousarray(signatures[nonEmpty, band * rows:(band + 1) * rows])
+		keys = bandSignatures.view(np.dtype((np.void, bandSignatures.dtype.itemsize * rows))).ravel()
+		first, second = bucketPairs(keys)
+		first, second = nonEmpty[first], nonEmpty[second]
+		if classPairs is not None:
+			keep = allowed[classes[first], classes[second]]
+			first, second = first[keep], second[keep]
+		pairCodes.append(first.astype(np.int64) * numberOfBusinesses + second)
+	pairCodes = np.unique(np.concatenate(pairCodes)) if pairCodes else np.zeros(0, dtype=np.int64)
+	return pairCodes // numberOfBusinesses, pairCodes % numberOfBusinesses
+
+def sizeClasses(userCounts):
+	#businesses whose user counts are within a factor of two share a class; -1 for businesses without users
+	classes = np.full(len(userCounts), -1, dtype=np.int64)
+	nonEmpty = userCounts > 0
+	classes[nonEmpty] = np.floor(np.log2(userCounts[nonEmpty])).astype(np.int64)
+	return classes
+
+def planClassPairs(userCounts, classes, threshold, numberOfHashes=DEFAULT_HASHES, maxFalseNegativeRate=0.05):
+	#groups the pairs of size classes by the split chosen for their Jaccard bound; the pairs no split can band
+	#without missing more than maxFalseNegativeRate at the bound are grouped under None and compared exactly
+	present = np.unique(classes[classes >= 0])
+	smallest = dict((sizeClass, userCounts[classes == sizeClass].min()) for sizeClass in present)
+	largest = dict((sizeClass, userCounts[classes == sizeClass].max()) for sizeClass in present)
+	plans = {}
+	for i, smallerClass in enumerate(present):
+		for largerClass in present[i:]:
+			bound = jaccardBound(threshold, smallest[smallerClass], largest[largerClass])
+			bands, rows = chooseBands(numberOfHashes, bound, maxFalseNegativeRate)
+			plan = (bands, rows) if 1. - candidateProbability(bound, bands, rows) <= maxFalseNegativeRate else None
+			plans.setdefault(plan, []).append((smallerClass, largerClass))
+	return plans
+
+def classPairOverlaps(incidence, classes, smallerClass, largerClass, blockSize=2048):
+	#exact overlaps of every business pair between two size classes, as upper-triangular (row, column, overlap)
+	first = np.flatnonzero(classes == smallerClass)
+	second = np.flatnonzero(classes == largerClass)
+	secondTransposed = incidence[second].T.tocsr()
+	rowParts, columnParts, overlapParts = [], [], []
+	for start in range(0, len(first), blockSize):
+		block = first[start:start + blockSize]
+		products = incidence[block].dot(secondTransposed).tocoo()
+		rows, columns = block[products.row], second[products.col]
+		keep = rows < columns if smallerClass == largerClass else np.ones(len(rows), dtype=bool)
+		rowParts.append(np.minimum(rows, columns)[keep])
+		columnParts.append(np.maximum(rows, columns)[keep])
+		overlapParts.append(products.data[keep].astype(np.float64))
+	if not rowParts:
+		return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+	return np.concatenate(rowParts), np.concatenate(columnParts), np.concatenate(overlapParts)
+
+def exactOverlap(incidence, rows, columns, blockSize=100000):
+	overlap = np.zeros(len(rows))
+	for start in range(0, len(rows), blockSize):
+		stop = start + blockSize
+		products = incidence[rows[start:stop]].multiply(incidence[columns[start:stop]])
+		overlap[start:stop] = np.asarray(products.sum(axis=1)).ravel()
+	return overlap
+
+def computeApproximateWeights(incidence, userCounts=None, threshold=0.1, numberOfHashes=DEFAULT_HASHES, bands=None, seed=0, minOverlap=1, minWeight=0.,
+		maxFalseNegativeRate=0.05):
+	#same upper-triangular weights as coReviewMatrix.computeOverlapWeights, but only for the pairs LSH proposes.
+	#threshold is an edge weight: each pair of size classes is banded for the lowest Jaccard similarity a pair of
+	#its sizes can have at that weight, so about 1 - maxFalseNegativeRate of the edges at or above it are found.
+	#Pairs of classes too far apart in size for that are compared exactly. With bands, one split is used for all pairs
+	incidence = sparse.csr_matrix(incidence)
+	numberOfBusinesses = incidence.shape[0]
+	if userCounts is None:
+		userCounts = np.asarray(incidence.sum(axis=1)).ravel()
+	userCounts = np.asarray(userCounts, dtype=np.float64)
+	if bands is not None:
+		rows = numberOfHashes // bands
+		plans = {(bands, rows): None}
+	else:
+		classes = sizeClasses(userCounts)
+		plans = planClassPairs(userCounts, classes, threshold, numberOfHashes, maxFalseNegativeRate)
+	rowParts, columnParts, overlapParts = [], [], []
+	if any(plan is not None for plan in plans):
+		signatures = minHashSignatures(incidence, numberOfHashes, seed)
+	for plan, classPairs in plans.items():
+		if plan is None:
+			for smallerClass, largerClass in classPairs:
+				pairRows, pairColumns, overlap = classPairOverlaps(incidence, classes, smallerClass, largerClass)
+				rowParts.append(pairRows)
+				columnParts.append(pairColumns)
+				overlapParts.append(overlap)
+		else:
+			pairRows, pairColumns = candidatePairs(signatures, plan[0], plan[1], classes if classPairs is not None else None, classPairs)
+			rowParts.append(pairRows)
+			columnParts.append(pairColumns)
+			overlapParts.append(exactOverlap(incidence, pairRows, pairColumns))
+	if not rowParts:
+		return sparse.csr_matrix((numberOfBusinesses, numberOfBusinesses))
+	pairRows, pairColumns, overlap = np.concatenate(rowParts), np.concatenate(columnParts), np.concatenate(overlapParts)
+	keep = overlap >= max(minOverlap, 1)
+	pairRows, pairColumns, overlap = pairRows[keep], pairColumns[keep], overlap[keep]
+	weights = coReviewMatrix.overlapToWeights(pairRows, pairColumns, overlap, userCounts)
+	keep = weights > minWeight
+	return sparse.csr_matrix((weights[keep], (pairRows[keep], pairColumns[keep])), shape=(numberOfBusinesses, numberOfBusinesses))
+
+def computeApproximateWeightMatrix(businessesWithSatisfiedUsers, threshold=0.1, numberOfHashes=DEFAULT_HASHES, bands=None, seed=0, minOverlap=1, minWeight=0.,
+		maxFalseNegativeRate=0.05):
+	incidence, userCounts, businessIds = coReviewMatrix.buildIncidenceMatrixFromDataFrame(businessesWithSatisfiedUsers)
+	weightMatrix = computeApproximateWeights(incidence, userCounts, threshold, numberOfHashes, bands, seed, minOverlap, minWeight, maxFalseNegativeRate)
+	return weightMatrix, businessIds
+
+def recall(exactMatrix, approximateMatrix, minWeight=0.):
+	#share of exact edges above minWeight that the approximate matrix also found (its weights are exact, so precision is 1)
+	exactMatrix = sparse.csr_matrix(exactMatrix)
+	exactMatrix = exactMatrix.multiply(exactMatrix > minWeight).tocsr()
+	if exactMatrix.nnz == 0:
+		return 1.
+	found = exactMatrix.multiply(sparse.csr_matrix(approximateMatrix) > 0)
+	return float(found.nnz) / exactMatrix.nnz
+
+def compareWithExact(businessesWithSatisfiedUsers, thresholds=(0.05, 0.1, 0.2), hashCounts=(64, 128, 256), weightCutoffs=(0., 0.05, 0.1, 0.2), seed=0,
+		maxFalseNegativeRate=0.05):
+	#recall and run time of each LSH setting against the exact engine, e.g. on the Las Vegas businessesWithSatisfiedUsers.csv;
+	#recallAtThreshold is the recall of the edges heavier than the setting's threshold, which should be about 1 - maxFalseNegativeRate
+	if not isinstance(businessesWithSatisfiedUsers, pd.DataFrame):
+		businessesWithSatisfiedUsers = pd.read_csv(businessesWithSatisfiedUsers)
+	incidence, userCounts, businessIds = coReviewMatrix.buildIncidenceMatrixFromDataFrame(businessesWithSatisfiedUsers)
+	startTime = time.time()
+	exactMatrix = coReviewMatrix.computeOverlapWeights(incidence, userCounts)
+	exactSeconds = time.time() - startTime
+	report = []
+	for numberOfHashes in hashCounts:
+		for threshold in thresholds:
+			plans = planClassPairs(userCounts, sizeClasses(userCounts), threshold, numberOfHashes, maxFalseNegativeRate)
+			startTime = time.time()
+			approximateMatrix = computeApproximateWeights(incidence, userCounts, threshold, numberOfHashes, seed=seed, maxFalseNegativeRate=maxFalseNegativeRate)
+			seconds = time.time() - startTime
+			#e.g. "64x2 128x1": bands x rows of each split used, and how many pairs of size classes were compared exactly
+			splits = " ".join("%dx%d" % plan for plan in sorted(plan for plan in plans if plan is not None))
+			entry = {'hashes': numberOfHashes, 'threshold': threshold, 'splits': splits, 'exactClassPairs': len(plans.get(None, [])),
+				'seconds': seconds, 'exactSeconds': exactSeconds, 'edges': approximateMatrix.nnz, 'exactEdges': exactMatrix.nnz,
+				'recallAtThreshold': recall(exactMatrix, approximateMatrix, threshold)}
+			for cutoff in weightCutoffs:
+				entry['recall>%g' % cutoff] = recall(exactMatrix, approximateMatrix, cutoff)
+			report.append(entry)
+	columns = ['hashes', 'threshold', 'splits', 'exactClassPairs', 'seconds', 'exactSeconds', 'edges', 'exactEdges', 'recallAtThreshold']
+	columns += ['recall>%g' % cutoff for cutoff in weightCutoffs]
+	return pd.DataFrame(report, columns=columns)
+
+
+if __name__ == '__main__':
+	print compareWithExact("businessesWithSatisfiedUsers.csv").to_string(index=False)
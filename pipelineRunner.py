@@ -0,0 +1,237 @@
+import hashlib
+import inspect
+import json
+import os
+import featureExecutor
+
+STATE_FILE = ".pipelineState.json"
+HASH_BLOCK_SIZE = 1 << 20
+
+
+class Stage(object):
+	#function(**params) must read exactly `inputs` and write exactly `outputs`; a file in both is updated in place;
+	#codeDependencies lists extra modules or functions whose code the stage depends on but does not reach through its globals
+
+	def __init__(self, name, function, inputs=(), outputs=(), params=None, codeDependencies=()):
+		self.name = name
+		self.function = function
+		self.inputs = list(inputs)
+		self.outputs = list(outputs)
+		self.params = params or {}
+		self.codeDependencies = list(codeDependencies)
+
+	def run(self):
+		return self.function(**self.params)
+
+	def codeHash(self):
+		#instrumented stages are hashed by the function they wrap, not by the shared wrapper, together with the repo code it calls
+		function = unwrap(self.function)
+		sources = codeSources([function] + self.codeDependencies, moduleDirectory(function))
+		return hashlib.sha1("\n".join(sorted(sources)).encode("utf-8")).hexdigest()
+
+	def paramsHash(self):
+		return hashlib.sha1(repr(sorted(self.params.items())).encode("utf-8")).hexdigest()
+
+
+def unwrap(value):
+	return getattr(value, '__wrapped__', value)
+
+def moduleDirectory(value):
+	fileName = getattr(inspect.getmodule(value), '__file__', None)
+	return os.path.dirname(os.path.abspath(fileName)) if fileName else None
+
+def sourceOf(value):
+	try:
+		source = inspect.getsource(value)
+	except (IOError, TypeError):
+		source = getattr(value, '__name__', repr(value))
+	return source.decode("utf-8") if isinstance(source, bytes) else source
+
+def referencedNames(code):
+	#global and attribute names used by a code object and by the functions, lambdas and comprehensions nested in it
+	names = set(code.co_names)
+	for constant in code.co_consts:
+		if inspect.iscode(constant):
+			names |= referencedNames(constant)
+	return names
+
+def codeSources(values, directory):
+	#sources of the given functions, classes and modules, and of every function or class from modules in `directory`
+	#they reach through their globals or module attributes; module-level constants they read are included by value
+	sources = set()
+	seen = set()
+	pending = [unwrap(value) for value in values]
+	while pending:
+		value = pending.pop()
+		if id(value) in seen:
+			continue
+		seen.add(id(value))
+		sources.add(sourceOf(value))
+		if inspect.isclass(value):
+			pending.extend(member for member in vars(value).values() if inspect.isfunction(member))
+		if not inspect.isfunction(value):
+			continue
+		names = referencedNames(value.__code__)
+		for name in names:
+			if name not in value.__globals__:
+				continue
+			referenced = unwrap(value.__globals__[name])
+			if inspect.ismodule(referenced):
+				if moduleDirectory(referenced) != directory:
+					continue
+				#only the module attributes this function's code names, e.g. graphStore.saveGraphArrays
+				members = [(referenced.__name__, attribute, getattr(referenced, attribute)) for attribute in names if hasattr(referenced, attribute)]
+			else:
+				members = [(value.__module__, name, referenced)]
+			for moduleName, attribute, member in members:
+				member = unwrap(member)
+				if (inspect.isfunction(member) or inspect.isclass(member)) and moduleDirectory(member) == directory:
+					pending.append(member)
+				elif isinstance(member, (bool, int, long, float, basestring, tuple)):
+					sources.add("%s.%s = %r" % (moduleName, attribute, member))
+	return sources
+
+
+def loadState(stateFile=STATE_FILE):
+	if not os.path.exists(stateFile):
+		return {"stages": {}, "fileHashes": {}}
+	with open(stateFile) as f:
+		return json.load(f)
+
+def saveState(state, stateFile=STATE_FILE):
+	temporaryFile = stateFile + ".tmp"
+	with open(temporaryFile, "w") as f:
+		json.dump(state, f, indent=1, sort_keys=True)
+	os.rename(temporaryFile, stateFile)
+
+def fileHash(path, state):
+	#content hashes are memoized by (size, mtime) so unchanged multi-GB inputs are not re-read on every run
+	if not os.path.exists(path):
+		return None
+	fileStat = os.stat(path)
+	key = os.path.abspath(path)
+	cached = state["fileHashes"].get(key)
+	if cached is not None and cached["size"] == fileStat.st_size and cached["mtime"] == fileStat.st_mtime:
+		return cached["sha1"]
+	digest = hashlib.sha1()
+	with open(path, "rb") as f:
+		for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+			digest.update(block)
+	state["fileHashes"][key] = {"size": fileStat.st_size, "mtime": fileStat.st_mtime, "sha1": digest.hexdigest()}
+	return digest.hexdigest()
+
+def stageRecord(stage, state, inPlaceInputs):
+	return {
+		"code": stage.codeHash(),
+		"params": stage.paramsHash(),
+		"inputs": dict((path, fileHash(path, state)) for path in stage.inputs if path not in stage.outputs),
+		"inPlaceInputs": inPlaceInputs,
+		"outputs": dict((path, fileHash(path, state)) for path in stage.outputs)
+	}
+
+def inPlaceInputHashes(stage, state):
+	return dict((path, fileHash(path, state)) for path in stage.inputs if path in stage.outputs)
+
+def previousWriters(stages):
+	#for every file a stage updates in place, the stage declared before it that last wrote the file
+	lastWriter = {}
+	previous = {}
+	for stage in stages:
+		previous[stage.name] = dict((path, lastWriter.get(path)) for path in stage.inputs if path in stage.outputs)
+		for path in stage.outputs:
+			lastWriter[path] = stage.name
+	return previous
+
+def recordedOutputHashes(state):
+	outputHashes = {}
+	for recorded in state["stages"].values():
+		for path, digest in recorded["outputs"].items():
+			outputHashes.setdefault(path, set()).add(digest)
+	return outputHashes
+
+def isStageCurrent(stage, state, previousWriter):
+	recorded = state["stages"].get(stage.name)
+	if recorded is None:
+		return False
+	current = stageRecord(stage, state, {})
+	if current["code"] != recorded["code"] or current["params"] != recorded["params"] or current["inputs"] != recorded["inputs"]:
+		return False
+	if None in current["outputs"].values():
+		return False
+	#an in-place file must be the version this stage last read: whatever its previous writer left behind
+	outputHashes = recordedOutputHashes(state)
+	for path, writer in previousWriter.items():
+		if writer is None:
+			#a source file only this stage and later ones rewrite: it must not have changed since one of them wrote it
+			if current["outputs"][path] not in outputHashes.get(path, ()):
+				return False
+		elif writer not in state["stages"] or recorded["inPlaceInputs"].get(path) != state["stages"][writer]["outputs"].get(path):
+			return False
+	#other outputs may since have been updated in place by later stages, so any hash a stage recorded for them is fine
+	for path, digest in current["outputs"].items():
+		if path not in previousWriter and digest not in outputHashes.get(path, ()):
+			return False
+	return True
+
+def orderStages(stages):
+	#waves of stages whose inputs are produced by earlier waves only; stages within a wave are independent
+	producers = {}
+	for stage in stages:
+		for path in stage.outputs:
+			if path not in stage.inputs:
+				if path in producers:
+					raise ValueError("%s is written by both %s and %s" % (path, producers[path].name, stage.name))
+				producers[path] = stage
+	inPlaceWriters = {}
+	for stage in stages:
+		for path in stage.outputs:
+			if path in stage.inputs:
+				inPlaceWriters.setdefault(path, []).append(stage)
+	dependencies = {}
+	for stage in stages:
+		dependencies[stage.name] = set()
+		for path in stage.inputs:
+			if path in producers and producers[path] is not stage:
+				dependencies[stage.name].add(producers[path].name)
+			#readers of a file that is updated in place depend on the stages updating it that are declared before them
+			for writer in inPlaceWriters.get(path, []):
+				if stages.index(writer) < stages.index(stage):
+					dependencies[stage.name].add(writer.name)
+	waves = []
+	placed = set()
+	while len(placed) < len(stages):
+		wave = [stage for stage in stages if stage.name not in placed and dependencies[stage.name] <= placed]
+		if not wave:
+			raise ValueError("stages %s form a cycle" % ", ".join(stage.name for stage in stages if stage.name not in placed))
+		waves.append(wave)
+		placed.update(stage.name for stage in wave)
+	return waves
+
+def runStage(stage):
+	return stage.run()
+
+def runPipeline(stages, force=(), stateFile=STATE_FILE, workers=None):
+	#stages whose code, params, inputs and outputs match the last recorded run are skipped
+	state = loadState(stateFile)
+	rerun = set(force)
+	writers = previousWriters(stages)
+	ran = []
+	for wave in orderStages(stages):
+		stale = []
+		for stage in wave:
+			if stage.name in rerun or not isStageCurrent(stage, state, writers[stage.name]):
+				stale.append(stage)
+			else:
+				print "%s: up to date, skipped" % stage.name
+		inPlaceInputs = dict((stage.name, inPlaceInputHashes(stage, state)) for stage in stale)
+		if len(stale) == 1:
+			print "%s: running" % stale[0].name
+			stale[0].run()
+		elif stale:
+			print "running in parallel: %s" % ", ".join(stage.name for stage in stale)
+			featureExecutor.runTasks(runStage, stale, workers=workers, retries=0, progress=None)
+		for stage in stale:
+			state["stages"][stage.name] = stageRecord(stage, state, inPlaceInputs[stage.name])
+			saveState(state, stateFile)
+		ran.extend(stale)
+	return [stage.name for stage in ran]
@@ -0,0 +1,134 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+
+#Yelp-shaped tables for benchmarks: review and tip counts per business and per user follow a Zipf law, friend counts a power law
+#rank offsets flatten the head of the Zipf curves, so the busiest user writes hundreds of reviews rather than a few percent of all of them
+USER_RANK_OFFSET = 50
+BUSINESS_RANK_OFFSET = 20
+#bumped whenever the generated data changes, so datasets written by an older version are regenerated
+GENERATOR_VERSION = 2
+CITIES = [("Las Vegas", 36.17, -115.14, 0.5), ("Phoenix", 33.45, -112.07, 0.2), ("Toronto", 43.65, -79.38, 0.15),
+	("Madison", 43.07, -89.40, 0.1), ("Montreal", 45.50, -73.57, 0.05)]
+CATEGORIES = ["Restaurants", "Food", "Nightlife", "Bars", "Coffee & Tea", "Shopping", "Beauty & Spas", "Barbers",
+	"Mexican", "Pizza", "Italian", "Chinese", "Japanese", "Thai", "Burgers", "Fast Food", "Sandwiches", "Cocktail Bars",
+	"Dance Clubs", "Hotels & Travel", "Event Planning & Services", "Auto Repair", "Gyms", "Vegan", "Festivals"]
+SENTENCES = ["Great food and friendly staff.", "Would not come back.", "Best tacos in town!", "Service was slow but the view was worth it.",
+	"Decent prices, average quality.", "Amazing cocktails, loud music.", "Clean place, quick service.", "The owner is super nice."]
+STAR_PROBABILITIES = [0.11, 0.08, 0.11, 0.24, 0.46]
+FIRST_DAY = np.datetime64("2005-01-01")
+NUMBER_OF_DAYS = 14 * 365
+DATASET_FILE = "dataset.json"
+
+
+def businessIds(numberOfBusinesses):
+	return np.array(["b%021d" % i for i in range(numberOfBusinesses)])
+
+def userIds(numberOfUsers):
+	return np.array(["u%021d" % i for i in range(numberOfUsers)])
+
+def zipfProbabilities(n, exponent=1., offset=0.):
+	weights = 1. / (np.arange(1, n + 1) + offset) ** exponent
+	return weights / weights.sum()
+
+def skewedChoice(randomState, n, size, exponent=1., offset=0.):
+	#index 0 is the most popular; the popularity ranks are shuffled so ids do not encode them
+	ranks = randomState.choice(n, size=size, p=zipfProbabilities(n, exponent, offset))
+	return randomState.permutation(n)[ranks]
+
+def randomDates(randomState, size):
+	return (FIRST_DAY + randomState.randint(0, NUMBER_OF_DAYS, size).astype("timedelta64[D]")).astype(str)
+
+def generateBusinesses(randomState, numberOfBusinesses, reviewCounts):
+	cityNames, latitudes, longitudes, shares = zip(*CITIES)
+	cities = randomState.choice(len(CITIES), size=numberOfBusinesses, p=shares)
+	categoryPopularity = zipfProbabilities(len(CATEGORIES), 0.8)
+	categories = []
+	for size in randomState.randint(1, 5, numberOfBusinesses):
+		chosen = randomState.choice(len(CATEGORIES), size=size, replace=False, p=categoryPopularity)
+		categories.append(str([CATEGORIES[i] for i in chosen]))
+	return pd.DataFrame({
+		'business_id': businessIds(numberOfBusinesses),
+		'name': ["Business %d" % i for i in range(numberOfBusinesses)],
+		'city': np.array(cityNames)[cities],
+		'latitude': np.array(latitudes)[cities] + randomState.normal(0., 0.05, numberOfBusinesses),
+		'longitude': np.array(longitudes)[cities] + randomState.normal(0., 0.05, numberOfBusinesses),
+		'stars': np.round(randomState.uniform(1., 5., numberOfBusinesses) * 2) / 2,
+		'review_count': reviewCounts,
+		'categories': categories
+	}, columns=['business_id', 'name', 'city', 'latitude', 'longitude', 'stars', 'review_count', 'categories'])
+
+def generateComments(randomState, numberOfRows, numberOfBusinesses, numberOfUsers):
+	return pd.DataFrame({
+		'user_id': userIds(numberOfUsers)[skewedChoice(randomState, numberOfUsers, numberOfRows, 0.9, USER_RANK_OFFSET)],
+		'business_id': businessIds(numberOfBusinesses)[skewedChoice(randomState, numberOfBusinesses, numberOfRows, 1., BUSINESS_RANK_OFFSET)],
+		'date': randomDates(randomState, numberOfRows),
+		'text': np.array(SENTENCES)[randomState.randint(0, len(SENTENCES), numberOfRows)]
+	}, columns=['user_id', 'business_id', 'date', 'text'])
+
+def generateReviews(randomState, numberOfReviews, numberOfBusinesses, numberOfUsers):
+	reviews = generateComments(randomState, numberOfReviews, numberOfBusinesses, numberOfUsers)
+	reviews.insert(0, 'review_id', ["r%021d" % i for i in range(numberOfReviews)])
+	reviews.insert(3, 'stars', randomState.choice(5, size=numberOfReviews, p=STAR_PROBABILITIES) + 1)
+	for column in ['useful', 'funny', 'cool']:
+		reviews[column] = randomState.geometric(0.5, numberOfReviews) - 1
+	return reviews
+
+def generateTips(randomState, numberOfTips, numberOfBusinesses, numberOfUsers):
+	tips = generateComments(randomState, numberOfTips, numberOfBusinesses, numberOfUsers)
+	tips['likes'] = randomState.geometric(0.8, numberOfTips) - 1
+	return tips
+
+def generateUsers(randomState, numberOfUsers, reviewCounts, meanFriends=10.):
+	#friend counts are Pareto distributed; friendships are not made symmetric, as in the Yelp dump
+	ids = userIds(numberOfUsers)
+	exponent = 1.5
+	degrees = np.minimum((randomState.pareto(exponent, numberOfUsers) * meanFriends * (exponent - 1)).astype(np.int64), numberOfUsers - 1)
+	friendIndices = randomState.randint(0, numberOfUsers, degrees.sum())
+	offsets = np.concatenate([[0], np.cumsum(degrees)])
+	friends = [", ".join(ids[friendIndices[offsets[i]:offsets[i + 1]]]) if degrees[i] else "None" for i in range(numberOfUsers)]
+	return pd.DataFrame({
+		'user_id': ids,
+		'name': ["User %d" % i for i in range(numberOfUsers)],
+		'review_count': reviewCounts,
+		'yelping_since': randomDates(randomState, numberOfUsers),
+		'friends': friends
+	}, columns=['user_id', 'name', 'review_count', 'yelping_since', 'friends'])
+
+def generateCheckins(randomState, reviewCounts):
+	numberOfBusinesses = len(reviewCounts)
+	hasCheckins = randomState.uniform(size=numberOfBusinesses) < 0.8
+	return pd.DataFrame({
+		'business_id': businessIds(numberOfBusinesses)[hasCheckins],
+		'checkinSum': randomState.poisson(3. * reviewCounts[hasCheckins] + 1.)
+	}, columns=['business_id', 'checkinSum'])
+
+def datasetSizes(numberOfBusinesses):
+	#ratios roughly those of the public Yelp dump
+	return {'businesses': numberOfBusinesses, 'users': 8 * numberOfBusinesses, 'reviews': 30 * numberOfBusinesses, 'tips': 6 * numberOfBusinesses}
+
+def writeDataset(directory, numberOfBusinesses, seed=0):
+	#business.csv, review.csv, tip.csv, user.csv and checkin.csv; an existing dataset with the same size and seed is reused
+	sizes = datasetSizes(numberOfBusinesses)
+	parameters = dict(sizes, seed=seed, version=GENERATOR_VERSION)
+	datasetFile = os.path.join(directory, DATASET_FILE)
+	if os.path.exists(datasetFile):
+		with open(datasetFile) as f:
+			if json.load(f) == parameters:
+				return parameters
+	if not os.path.isdir(directory):
+		os.makedirs(directory)
+	randomState = np.random.RandomState(seed)
+	reviews = generateReviews(randomState, sizes['reviews'], sizes['businesses'], sizes['users'])
+	reviews.to_csv(os.path.join(directory, "review.csv"), index=False)
+	businessReviewCounts = np.bincount(reviews.business_id.str[1:].astype(np.int64), minlength=sizes['businesses'])
+	userReviewCounts = np.bincount(reviews.user_id.str[1:].astype(np.int64), minlength=sizes['users'])
+	del reviews
+	generateBusinesses(randomState, sizes['businesses'], businessReviewCounts).to_csv(os.path.join(directory, "business.csv"), index=False)
+	generateTips(randomState, sizes['tips'], sizes['businesses'], sizes['users']).to_csv(os.path.join(directory, "tip.csv"), index=False)
+	generateUsers(randomState, sizes['users'], userReviewCounts).to_csv(os.path.join(directory, "user.csv"), index=False)
+	generateCheckins(randomState, businessReviewCounts).to_csv(os.path.join(directory, "checkin.csv"), index=False)
+	with open(datasetFile, "w") as f:
+		json.dump(parameters, f)
+	return parameters